@@ -59,8 +59,10 @@ class AppMixin:
         DestructionManager()
 
         from photofilmstrip.lib.jobimpl.JobManager import JobManager
+        from photofilmstrip.lib.Settings import Settings
         JobManager().Init(workerCount=2)
-        JobManager().Init("render")
+        JobManager().Init("render",
+                          useProcesses=Settings().GetRenderProcesses())
 
         try:
             return self._OnStart()
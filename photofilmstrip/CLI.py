@@ -20,6 +20,7 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import multiprocessing
 import sys
 from photofilmstrip.AppMixin import AppMixin
 
@@ -41,6 +42,7 @@ class CliApp(AppMixin):
 
 
 def main():
+    multiprocessing.freeze_support()
     cliApp = CliApp()
 
 #    import hotshot
@@ -20,6 +20,7 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import multiprocessing
 import os
 import tempfile
 import sys
@@ -46,6 +47,7 @@ class GuiApp(AppMixin):
 
 
 def main():
+    multiprocessing.freeze_support()
     guiApp = GuiApp()
     guiApp.Start()
 
@@ -31,6 +31,8 @@ from photofilmstrip.core.Renderer import RENDERERS
 from photofilmstrip.core.RenderEngine import RenderEngineSlideshow, \
     RenderEngineTimelapse
 from photofilmstrip.core.RenderJob import RenderJob
+from photofilmstrip.core.FramePlan import FramePlan
+from photofilmstrip.core.SegmentCache import SegmentCache
 from photofilmstrip.core.GPlayer import GPlayer
 
 
@@ -39,12 +41,43 @@ class ActionRender(IAction):
     def __init__(self, photoFilmStrip,
                  profile,
                  rendererClass, draftMode,
-                 outpath=None):
+                 outpath=None,
+                 proxyFactor=1, proxyUpscale=False,
+                 firstFrame=0, endFrame=None,
+                 useSegmentCache=False, frameCache=None, taskWindow=None):
+        '''
+        :param proxyFactor: 1 for a full render, 2 or 4 to render a proxy at
+                            1/proxyFactor of the resolution of the profile
+        :param proxyUpscale: if True the proxy is scaled up to the
+                             resolution of the profile by the encoder
+        :param firstFrame: the first frame of a partial render, a float is a
+                           time in seconds
+        :param endFrame: the frame after the last frame of a partial render,
+                         a float is a time in seconds, None to render up to
+                         the end
+        :param useSegmentCache: encode the segments of a slideshow on their
+                                own and reuse unchanged segments of a
+                                previous render, see SegmentCache
+        :param frameCache: an optional FrameCache to reuse the frames of
+                           previous renders
+        :param taskWindow: the number of frames rendered ahead of the
+                           encoder, None for the default of RenderJob
+        '''
         self.__photoFilmStrip = photoFilmStrip
         self.__profile = profile
+        if proxyFactor > 1:
+            self.__renderProfile = profile.CreateProxy(proxyFactor,
+                                                       proxyUpscale)
+        else:
+            self.__renderProfile = profile
         self.__rendererClass = rendererClass
         self.__draftMode = draftMode
         self.__outpath = outpath
+        self.__firstFrame = firstFrame
+        self.__endFrame = endFrame
+        self.__useSegmentCache = useSegmentCache
+        self.__frameCache = frameCache
+        self.__taskWindow = taskWindow
 
         self.__renderJob = None
 
@@ -56,7 +89,7 @@ class ActionRender(IAction):
             return
 
         outpath = os.path.dirname(self.__photoFilmStrip.GetFilename())
-        outpath = os.path.join(outpath, self.__profile.GetName())
+        outpath = os.path.join(outpath, self.__renderProfile.GetName())
         if not os.path.exists(outpath):
             os.makedirs(outpath)
         return outpath
@@ -94,7 +127,7 @@ class ActionRender(IAction):
             totalLength = int(round((audioLength + 500) / 1000.0))
 
         renderer = self.__rendererClass()
-        renderer.Init(self.__profile,
+        renderer.Init(self.__renderProfile,
                       self.__photoFilmStrip.GetAspect(),
                       outpath)
 
@@ -102,21 +135,92 @@ class ActionRender(IAction):
 
         if self.__photoFilmStrip.GetTimelapse():
             renderEngine = RenderEngineTimelapse(outpath,
-                                                 self.__profile,
+                                                 self.__renderProfile,
                                                  self.__photoFilmStrip.GetPictures(),
                                                  self.__draftMode)
         else:
             renderEngine = RenderEngineSlideshow(outpath,
-                                                 self.__profile,
+                                                 self.__renderProfile,
                                                  self.__photoFilmStrip.GetPictures(),
                                                  self.__draftMode,
                                                  totalLength)
 
+        firstFrame = self.__GetFrameIndex(renderEngine, self.__firstFrame)
+        endFrame = self.__GetFrameIndex(renderEngine, self.__endFrame, True)
+        if firstFrame > 0 or endFrame is not None:
+            renderEngine.SetFrameRange(firstFrame, endFrame)
+            renderer.SetFrameRange(*renderEngine.GetFrameRange())
+        elif self.__useSegmentCache and outpath is not None and \
+                self.__rendererClass.SupportsSegments() and \
+                not self.__photoFilmStrip.GetTimelapse():
+            self.__SetupSegments(outpath, renderer, renderEngine)
+
         name = "%s (%s)" % (self.__photoFilmStrip.GetName(),
-                            self.__profile.GetName())
+                            self.__renderProfile.GetName())
+
+        if self.__frameCache is None:
+            sourceTasks = renderEngine.IterSourceTasks()
+        else:
+            # most frames of a render with a frame cache need no picture
+            sourceTasks = None
 
         self.__renderJob = RenderJob(name, renderer,
-                                     renderEngine.GetTasks())
+                                     renderEngine.IterTasks(),
+                                     taskCount=renderEngine.GetTaskCount(),
+                                     frameCache=self.__frameCache,
+                                     sourceTasks=sourceTasks,
+                                     taskWindow=self.__taskWindow)
+        if self.__rendererClass.IsInteractive():
+            # a preview pauses running exports between their workloads
+            self.__renderJob.SetPriority(RenderJob.PRIORITY_INTERACTIVE)
+
+    def __GetFrameIndex(self, renderEngine, position, isEnd=False):
+        '''
+        Converts a position of a partial render into a frame index, times
+        are mapped by RenderEngine.GetFrameIndex().
+        '''
+        if not isinstance(position, float):
+            return position
+        frameRate = self.__renderProfile.GetFrameRate().AsFloat()
+        if isEnd and position * frameRate >= renderEngine.GetFrameCount():
+            # up to the end
+            return None
+        return renderEngine.GetFrameIndex(position)
+
+    def __SetupSegments(self, outpath, renderer, renderEngine):
+        '''
+        Renders only the segments that are missing in the segment cache.
+        '''
+        logging.warning("the segment cache is experimental, check the "
+                        "joined video before publishing it")
+        profile = self.__renderProfile
+        context = (self.__rendererClass.__name__,
+                   [(prop, self.__rendererClass.GetProperty(prop))
+                    for prop in self.__rendererClass.GetProperties()],
+                   profile.GetName(), profile.GetResolution(),
+                   profile.GetEncoderResolution(),
+                   profile.GetFrameRate().AsStr(), profile.GetBitrate(),
+                   self.__photoFilmStrip.GetAspect(), self.__draftMode,
+                   FramePlan.FRAME_TOLERANCE)
+        withComment = "RenderSubtitle" in self.__rendererClass.GetProperties() \
+            and renderer.GetTypedProperty("RenderSubtitle", bool)
+        segmentCache = SegmentCache(os.path.join(outpath, "segments"), context)
+
+        segments = []
+        frameRanges = []
+        for segment in renderEngine.GetSegments():
+            if segment.frameCount == 0:
+                continue
+            key = segmentCache.GetKey(segment, withComment)
+            segments.append((key, segment.firstFrame, segment.frameCount))
+            if not segmentCache.Contains(key):
+                frameRanges.append((segment.firstFrame,
+                                    segment.firstFrame + segment.frameCount))
+        logging.debug("%s of %s segments need to be rendered",
+                      len(frameRanges), len(segments))
+
+        renderer.SetSegments(segmentCache, segments)
+        renderEngine.SetFrameRanges(frameRanges)
 
     def GetRenderJob(self):
         return self.__renderJob
@@ -30,6 +30,9 @@ from photofilmstrip.lib.util import CheckFile
 from photofilmstrip.core.OutputProfile import (
     GetOutputProfiles, GetMPEGProfiles)
 from photofilmstrip.core.ProjectFile import ProjectFile
+from photofilmstrip.core.exceptions import RenderException
+from photofilmstrip.core.FrameCache import FrameCache
+from photofilmstrip.core.RenderJob import RenderJob
 from photofilmstrip.core.Renderer import RENDERERS
 from photofilmstrip.core.renderer.StreamRenderer import StreamRenderer
 from photofilmstrip.action.ActionRender import ActionRender
@@ -100,6 +103,22 @@ class DummyGui(IVisualJobHandler):
         pass
 
 
+def ParseFramePosition(value):
+    '''
+    Converts a position given as time [[HH:]MM:]SS[.ms] or as frame index
+    with the suffix f (e.g. 750f).
+    :returns: the frame index as int or the time in seconds as float, see
+              ActionRender
+    '''
+    if value.endswith("f"):
+        return int(value[:-1])
+
+    seconds = 0.0
+    for part in value.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
 def main(showHelp=False):
     parser = OptionParser(prog="%s-cli" % Constants.APP_NAME.lower(),
                           version="%%prog %s" % Constants.APP_VERSION_EX)
@@ -117,6 +136,14 @@ def main(showHelp=False):
     parser.add_option("-n", "--videonorm", help=_(u"Option videonorm is deprecated, use an appropriate profile!"))
     parser.add_option("-f", "--format", help=formatStr + " [default: %default]", default=4, type="int")
     parser.add_option("-a", "--draft", action="store_true", default=False, help=u"%s - %s" % (_(u"enable draft mode"), _(u"Activate this option to generate a preview of your PhotoFilmStrip. The rendering process will speed up dramatically, but results in lower quality.")))
+    parser.add_option("-x", "--proxy", help=_(u"render a proxy at 1/N of the resolution of the profile, N is 2 or 4") + " [default: %default]", default=1, type="int", metavar="N")
+    parser.add_option("-u", "--proxy-upscale", action="store_true", default=False, help=_(u"scale the proxy up to the resolution of the profile"))
+    parser.add_option("-s", "--start", help=_(u"start a partial render at this time [[HH:]MM:]SS[.ms] or at this frame with the suffix f, e.g. 1:30 or 750f"), metavar="POS")
+    parser.add_option("-e", "--end", help=_(u"end a partial render before this time [[HH:]MM:]SS[.ms] or before this frame with the suffix f"), metavar="POS")
+    parser.add_option("-c", "--segment-cache", action="store_true", default=False, help=_(u"reuse unchanged segments of a previous render (experimental)"))
+    parser.add_option("--frame-cache", help=_(u"reuse the frames of previous renders that are stored in this directory"), metavar="PATH")
+    parser.add_option("--frame-cache-size", help=_(u"maximum size of the frame cache in MB") + " [default: %default]", default=2048, type="int", metavar="MB")
+    parser.add_option("--look-ahead", help=_(u"maximum number of frames rendered ahead of the encoder") + " [default: %default]", default=RenderJob.TASK_WINDOW, type="int", metavar="N")
     parser.add_option("-d", "--debug", action="store_true", default=False, help=u"enable debug logging")
 
     if showHelp:
@@ -152,6 +179,44 @@ def main(showHelp=False):
         return 3
     profile = profiles[options.profile]
 
+    if options.proxy not in (1, 2, 4):
+        parser.print_help()
+        logging.error(_(u"invalid proxy factor specified: %s"), options.proxy)
+        return 9
+
+    try:
+        firstFrame = 0
+        endFrame = None
+        if options.start:
+            firstFrame = ParseFramePosition(options.start)
+        if options.end:
+            endFrame = ParseFramePosition(options.end)
+    except ValueError:
+        parser.print_help()
+        logging.error(_(u"invalid start or end specified: %s - %s"),
+                      options.start, options.end)
+        return 11
+
+    if options.look_ahead <= 0:
+        parser.print_help()
+        logging.error(_(u"invalid look-ahead specified: %s"),
+                      options.look_ahead)
+        return 14
+
+    frameCache = None
+    if options.frame_cache:
+        if options.frame_cache_size <= 0:
+            parser.print_help()
+            logging.error(_(u"invalid frame cache size specified: %s"),
+                          options.frame_cache_size)
+            return 13
+        try:
+            frameCache = FrameCache(os.path.abspath(options.frame_cache),
+                                    options.frame_cache_size * 1024 * 1024)
+        except OSError as err:
+            logging.error(_(u"cannot create frame cache: %s"), err)
+            return 13
+
     prjFile = ProjectFile(filename=options.project)
     if not prjFile.Load():
         logging.error(_(u"cannot load photofilmstrip"))
@@ -173,7 +238,10 @@ def main(showHelp=False):
         outpath = None
 
     project = prjFile.GetProject()
-    ar = ActionRender(project, profile, rendererClass, False, outpath)
+    ar = ActionRender(project, profile, rendererClass, False, outpath,
+                      options.proxy, options.proxy_upscale,
+                      firstFrame, endFrame, options.segment_cache,
+                      frameCache, options.look_ahead)
 
     audioFile = project.GetAudioFile()
     if not CheckFile(audioFile):
@@ -187,7 +255,11 @@ def main(showHelp=False):
 
     cliGui.Info(options.project, rendererClass, profile)
 
-    ar.Execute()
+    try:
+        ar.Execute()
+    except RenderException as exc:
+        logging.error(exc.GetMessage())
+        return 12
     renderJob = ar.GetRenderJob()
     renderJob.AddVisualJobHandler(cliGui)
 
@@ -201,9 +273,16 @@ def main(showHelp=False):
         cliGui.Write("\n" + _(u"...aborted!"))
         return 10
 
+    if renderJob.GetErrorMessage():
+        logging.error(renderJob.GetErrorMessage())
+        return 12
+
     resultObj = renderJob.GetResultObject()
     result = resultObj.GetResult()
     if result:
         cliGui.Write(_(u"all done"))
+        if frameCache is not None:
+            cliGui.Write(_(u"frame cache: %s hits, %s misses") %
+                         renderJob.GetFrameCacheStatistics())
 #    else:
 #        logging.error(_(u"Error: %s"), renderEngine.GetErrorMessage())
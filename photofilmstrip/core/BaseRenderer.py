@@ -38,6 +38,7 @@ class BaseRenderer(metaclass=MetaBaseRenderer):
         self._profile = None
         self._audioFiles = []
         self._aspect = None
+        self._frameRange = (0, None)
 
     def Init(self, profile, aspect, outputPath):
         self._outputPath = outputPath
@@ -102,6 +103,36 @@ class BaseRenderer(metaclass=MetaBaseRenderer):
     def SetAudioFiles(self, audioFiles):
         self._audioFiles = audioFiles
 
+    @classmethod
+    def SupportsSegments(cls):
+        '''
+        Returns True if the renderer can encode segments on their own and
+        join them later, see SegmentCache.
+        '''
+        return False
+
+    @classmethod
+    def IsInteractive(cls):
+        '''
+        Returns True if the user watches the frames while they are rendered,
+        such a render job is processed before other render jobs.
+        '''
+        return False
+
+    def SetFrameRange(self, firstFrame, endFrame):
+        '''
+        Sets the frames of a partial render, the first frame passed to
+        ToSink() is the frame with index firstFrame in a full render.
+        :param endFrame: the index after the last frame, None for the end
+        '''
+        self._frameRange = (firstFrame, endFrame)
+
+    def GetFrameRange(self):
+        return self._frameRange
+
+    def IsPartial(self):
+        return self._frameRange != (0, None)
+
     def GetAudioFile(self):
         '''
         compatibility
@@ -132,6 +163,13 @@ class BaseRenderer(metaclass=MetaBaseRenderer):
     def ToSink(self, data):
         raise NotImplementedError()
 
+    def SkipFrame(self):
+        '''
+        Called instead of ToSink() for a frame that failed to render, so the
+        renderer can keep track of the position of the following frames.
+        '''
+        pass
+
     def ProcessAbort(self):
         raise NotImplementedError()
 
@@ -144,6 +182,13 @@ class FinalizeHandler(object):
     def UseSmartFinalize(self):
         raise NotImplementedError()
 
+    def UseRemoteFinalize(self):
+        '''
+        Returns True if the handler and its results can be passed between
+        processes, so the frames are finalized in a WorkerProcess.
+        '''
+        return False
+
 
 class ImageDataFinalizeHandler(FinalizeHandler):
 
@@ -154,7 +199,58 @@ class ImageDataFinalizeHandler(FinalizeHandler):
     def UseSmartFinalize(self):
         return True
 
+    def UseRemoteFinalize(self):
+        return True
+
     def ProcessFinalize(self, pilImg):
         res = io.BytesIO()
         pilImg.save(res, self._format, quality=self._quality)
         return res.getvalue()
+
+
+class RawFrameFinalizeHandler(FinalizeHandler):
+    '''
+    Converts the frames to uncompressed video data as expected by GStreamer
+    for video/x-raw, so no codec is involved between the workers and the
+    video encoder. The rows of each plane are padded to multiples of 4 bytes
+    like the default strides of GStreamer.
+    '''
+
+    # scales full range YCbCr (JFIF) to the limited range of BT.601
+    YCBCR_TO_BT601 = [16 + (i * 219 + 127) // 255 for i in range(256)] + \
+                     [16 + (i * 224 + 127) // 255 for i in range(256)] * 2
+
+    def __init__(self, formt):
+        '''
+        :param formt: "RGB" or "I420"
+        '''
+        self._format = formt
+
+    def UseSmartFinalize(self):
+        return True
+
+    def UseRemoteFinalize(self):
+        return True
+
+    def ProcessFinalize(self, pilImg):
+        if self._format == "I420":
+            return self.__ToI420(pilImg)
+        return pilImg.tobytes("raw", "RGB", RoundUp4(pilImg.size[0] * 3))
+
+    def __ToI420(self, pilImg):
+        width = pilImg.size[0]
+        # luma of mode "L" uses the BT.601 coefficients, the chroma is
+        # converted after subsampling the RGB image which is much cheaper
+        # but the same as both are linear
+        lumaPlane = pilImg.convert("L").point(self.YCBCR_TO_BT601[:256])
+        chromaImg = pilImg.reduce(2).convert("YCbCr").point(self.YCBCR_TO_BT601)
+        _, cbPlane, crPlane = chromaImg.split()
+
+        chromaStride = RoundUp4(chromaImg.size[0])
+        return b"".join((lumaPlane.tobytes("raw", "L", RoundUp4(width)),
+                         cbPlane.tobytes("raw", "L", chromaStride),
+                         crPlane.tobytes("raw", "L", chromaStride)))
+
+
+def RoundUp4(value):
+    return (value + 3) & ~3
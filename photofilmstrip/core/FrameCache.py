@@ -0,0 +1,147 @@
+# encoding: UTF-8
+#
+# PhotoFilmStrip - Creates movies out of your pictures.
+#
+# Copyright (C) 2026 Jens Goepfert
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+import hashlib
+import io
+import logging
+import os
+import threading
+
+from PIL import Image
+
+from photofilmstrip.core.tasks import TaskLoadPic
+
+
+class FrameCache:
+    '''
+    Persistent cache for rendered frames that is shared by all render jobs.
+    The frames are stored as files named by a hash of the task key, the
+    draft mode and the modification time of the source pictures. If the
+    files exceed the size limit the least recently used ones are removed.
+    '''
+
+    # increase if the rendering changes, so old frames are not used anymore
+    VERSION = 1
+
+    # visually lossless and fast compared to PNG
+    FORMAT = "JPEG"
+    EXTENSION = "jpg"
+    QUALITY = 95
+
+    # remove files until the cache is below this fraction of the limit
+    PRUNE_FACTOR = 0.9
+
+    def __init__(self, cacheDir, maxBytes):
+        self.__cacheDir = cacheDir
+        self.__maxBytes = maxBytes
+        self.__lock = threading.Lock()
+        self.__logger = logging.getLogger("FrameCache")
+
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+        self.__bytes = sum(size for __, __, size in self.__IterFiles())
+        if self.__bytes > maxBytes:
+            # the limit may have been lowered since the last render
+            self.__Prune()
+
+    def __IterFiles(self):
+        '''
+        Yields the path, the time of the last access and the size of all
+        cached frames.
+        '''
+        for dirpath, __, filenames in os.walk(self.__cacheDir):
+            for filename in filenames:
+                if filename.endswith("." + self.EXTENSION):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    def GetKey(self, task):
+        '''
+        Returns the key of an imaging task, None if the task cannot be cached.
+        '''
+        parts = [self.VERSION, task.GetKey(), task.draft]
+        for subTask in task.IterSubTasks():
+            if isinstance(subTask, TaskLoadPic):
+                try:
+                    stat = os.stat(subTask.picture.GetFilename())
+                except OSError:
+                    return None
+                parts.append((stat.st_mtime_ns, stat.st_size))
+        return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+    def __GetPath(self, key):
+        return os.path.join(self.__cacheDir, key[:2],
+                            "{0}.{1}".format(key, self.EXTENSION))
+
+    def Get(self, key):
+        '''
+        Returns the cached frame as PIL image or None.
+        '''
+        path = self.__GetPath(key)
+        try:
+            img = Image.open(path)
+            img.load()
+            # the modification time is the time of the last access
+            os.utime(path)
+        except (OSError, SyntaxError):
+            return None
+        return img
+
+    def Put(self, key, img):
+        if img.mode not in ("RGB", "L"):
+            return
+        res = io.BytesIO()
+        img.save(res, self.FORMAT, quality=self.QUALITY, subsampling=0)
+        data = res.getvalue()
+
+        path = self.__GetPath(key)
+        tmpPath = "{0}.{1}.tmp".format(path, threading.get_ident())
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmpPath, "wb") as fd:
+                fd.write(data)
+            os.replace(tmpPath, path)
+        except OSError:
+            self.__logger.warning("cannot write frame %s", path, exc_info=1)
+            return
+
+        with self.__lock:
+            self.__bytes += len(data)
+            if self.__bytes > self.__maxBytes:
+                self.__Prune()
+
+    def __Prune(self):
+        files = sorted(self.__IterFiles(), key=lambda entry: entry[1])
+        self.__bytes = sum(size for __, __, size in files)
+        for path, __, size in files:
+            if self.__bytes <= self.__maxBytes * self.PRUNE_FACTOR:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.__bytes -= size
+        self.__logger.debug("pruned frame cache to %s bytes", self.__bytes)
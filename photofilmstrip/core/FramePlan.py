@@ -0,0 +1,191 @@
+# encoding: UTF-8
+#
+# PhotoFilmStrip - Creates movies out of your pictures.
+#
+# Copyright (C) 2026 Jens Goepfert
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+from array import array
+import itertools
+
+from photofilmstrip.core.tasks import TaskLoadPic, TaskCropResize, TaskTrans
+
+
+class FramePlan:
+    '''
+    Compact description of all frames of a render job. Every source picture
+    is held once in a table, the frames are rows in parallel arrays. The
+    tasks for a frame are created on demand by CreateTask().
+    '''
+
+    NO_SOURCE = -1
+
+    # rects that differ by less than this fraction of an output pixel render
+    # the same frame; larger values let slow movements judder
+    FRAME_TOLERANCE = 0.25
+
+    def __init__(self, resolution, draftMode):
+        self.__resolution = resolution
+        self.__draftMode = draftMode
+
+        # table of (picture, taskLoadPic)
+        self.__sources = []
+        self.__infos = []
+        self.__infoIdxs = {}
+
+        self.__infoIdx = array('i')
+        self.__source1 = array('i')
+        self.__source2 = array('i')
+        # x, y, width, height per frame
+        self.__rects1 = array('d')
+        self.__rects2 = array('d')
+        self.__transKind = array('b')
+        self.__progress = array('d')
+
+    def AddSource(self, picture, reduction=1):
+        '''
+        Adds a picture to the table of sources.
+        :param picture: a copy of the picture, it must not change anymore
+        :param reduction: the reduction the picture is loaded with
+        :returns: the index of the source
+        '''
+        self.__sources.append((picture, TaskLoadPic(picture, reduction)))
+        return len(self.__sources) - 1
+
+    def __GetInfoIdx(self, infoText):
+        infoIdx = self.__infoIdxs.get(infoText)
+        if infoIdx is None:
+            infoIdx = len(self.__infos)
+            self.__infos.append(infoText)
+            self.__infoIdxs[infoText] = infoIdx
+        return infoIdx
+
+    def AddFrame(self, infoText, source, rect):
+        '''
+        Adds a frame that shows a section of one source.
+        '''
+        self.AddFrames(infoText, source, (rect,))
+
+    @classmethod
+    def IterMergedRects(cls, rects, resolution):
+        '''
+        Replaces rects that are visually identical to the rect before by
+        that rect. The frames get the same task key, so the result cache
+        renders them only once. The rects are consumed on demand.
+        :param resolution: the output resolution
+        '''
+        resWidth, resHeight = resolution
+        rectBefore = None
+        tolerance = 0
+        for rect in rects:
+            if rectBefore is not None and \
+                    abs(rect[0] - rectBefore[0]) < tolerance and \
+                    abs(rect[1] - rectBefore[1]) < tolerance and \
+                    abs(rect[2] - rectBefore[2]) < tolerance and \
+                    abs(rect[3] - rectBefore[3]) < tolerance:
+                rect = rectBefore
+            elif rect[2] > 0 and rect[3] > 0:
+                rectBefore = rect
+                # tolerance in source pixels
+                tolerance = cls.FRAME_TOLERANCE * min(rect[2] / resWidth,
+                                                      rect[3] / resHeight)
+            yield rect
+
+    def AddFrames(self, infoText, source, rects):
+        '''
+        Adds a frame for each rect that shows a section of one source.
+        '''
+        rects = list(self.IterMergedRects(rects, self.__resolution))
+        count = len(rects)
+        self.__infoIdx.extend([self.__GetInfoIdx(infoText)] * count)
+        self.__source1.extend([source] * count)
+        self.__source2.extend([FramePlan.NO_SOURCE] * count)
+        self.__rects1.extend(itertools.chain.from_iterable(rects))
+        self.__rects2.extend([0.0] * (count * 4))
+        self.__transKind.extend([0] * count)
+        self.__progress.extend([0.0] * count)
+
+    def AddTransition(self, infoText, kind, progress,
+                      source1, rect1, source2, rect2):
+        '''
+        Adds a frame of a transition between two sources.
+        :param progress: the progress of the transition from 0 to 1
+        '''
+        self.__infoIdx.append(self.__GetInfoIdx(infoText))
+        self.__source1.append(source1)
+        self.__source2.append(source2)
+        self.__rects1.extend(rect1)
+        self.__rects2.extend(rect2)
+        self.__transKind.append(kind)
+        self.__progress.append(progress)
+
+    def GetFrameCount(self):
+        return len(self.__source1)
+
+    def GetSourceCount(self):
+        return len(self.__sources)
+
+    def GetSourceTasks(self, frameRanges):
+        '''
+        Returns the TaskLoadPic of the sources in the order they are first
+        used by the frames of the given ranges.
+        :param frameRanges: a list of (firstFrame, endFrame) tuples
+        '''
+        result = []
+        used = set()
+        for firstFrame, endFrame in frameRanges:
+            for sources in (self.__source1, self.__source2):
+                for source in set(sources[firstFrame:endFrame]):
+                    if source != FramePlan.NO_SOURCE and source not in used:
+                        used.add(source)
+                        result.append(source)
+        # the sources are added in the order of the frames
+        result.sort()
+        return [self.__sources[source][1] for source in result]
+
+    def __CreateCropResize(self, source, rects, idx):
+        picture, taskLoadPic = self.__sources[source]
+        rect = tuple(rects[idx * 4:idx * 4 + 4])
+        return TaskCropResize(picture, rect, self.__resolution,
+                              taskLoadPic=taskLoadPic)
+
+    def CreateTask(self, idx):
+        '''
+        Creates the task that renders the frame with the given index.
+        '''
+        taskPic1 = self.__CreateCropResize(self.__source1[idx],
+                                           self.__rects1, idx)
+        source2 = self.__source2[idx]
+        if source2 == FramePlan.NO_SOURCE:
+            task = taskPic1
+        else:
+            taskPic2 = self.__CreateCropResize(source2, self.__rects2, idx)
+            task = TaskTrans(self.__transKind[idx], self.__progress[idx],
+                             taskPic1, taskPic2, self.__resolution)
+        task.SetInfo(self.__infos[self.__infoIdx[idx]])
+        task.SetDraft(self.__draftMode)
+        return task
+
+    def IterTasks(self, firstFrame=0, endFrame=None):
+        '''
+        Yields the tasks of the frames from firstFrame up to but not
+        including endFrame.
+        '''
+        if endFrame is None:
+            endFrame = self.GetFrameCount()
+        for idx in range(firstFrame, endFrame):
+            yield self.CreateTask(idx)
@@ -50,6 +50,7 @@ class OutputProfile:
         self.__bitrate = bitrate
         self.__videoNorm = videoNorm
         self.__friendlyName = None
+        self.__encoderResolution = resolution
 
     def GetName(self, withRes=False):
         if self.__videoNorm:
@@ -65,8 +66,18 @@ class OutputProfile:
         return self.__bitrate
 
     def GetResolution(self):
+        '''
+        Returns the resolution the frames are rendered with.
+        '''
         return self.__resolution
 
+    def GetEncoderResolution(self):
+        '''
+        Returns the resolution of the encoded video, differs from
+        GetResolution() for upscaled proxies.
+        '''
+        return self.__encoderResolution
+
     def GetFrameRate(self):
         return self.__frameRate
 
@@ -85,6 +96,34 @@ class OutputProfile:
     def GetFriendlyName(self):
         return self.__friendlyName
 
+    def CreateProxy(self, factor, upscale=False):
+        '''
+        Creates a profile to render a quick proxy at 1/factor of the
+        resolution with the same timing. As the frames are smaller the
+        pictures get loaded with a higher reduction.
+        :param factor: 2 or 4
+        :param upscale: if True the frames are scaled up to the resolution
+                        of this profile by the encoder
+        '''
+        width, height = self.__resolution
+        # keep the size even for the chroma subsampling of the encoders
+        resolution = (max(2, width // factor // 2 * 2),
+                      max(2, height // factor // 2 * 2))
+        if self.__videoNorm:
+            # MPEG formats allow only the resolution of the video norm
+            upscale = True
+
+        proxy = OutputProfile(u"{0} ({1}x{2} proxy)".format(
+                                  self.__name, resolution[0], resolution[1]),
+                              resolution,
+                              self.__frameRate,
+                              self.__bitrate if upscale else self.__bitrate // factor,
+                              self.__videoNorm)
+        if upscale:
+            proxy.__encoderResolution = self.__resolution
+        proxy.SetFriendlyName(self.__friendlyName)
+        return proxy
+
 
 FPS15 = FrameRate(15.0, "15/1")
 FPS23996 = FrameRate(24000.0 / 1001.0, "24000/1001")
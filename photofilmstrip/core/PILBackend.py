@@ -19,10 +19,14 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import collections
 import logging
 import io
+import math
+import os
+import threading
 
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, ImageFile
 
 from photofilmstrip.core.Picture import Picture
 
@@ -39,74 +43,529 @@ def ImageFromBuffer(size, buffr):
     return pilImg
 
 
-def RotateExif(pilImg):
+# orientation of an image as number of counterclockwise quarter turns applied
+# after an optional horizontal flip, indexed by the EXIF orientation tag
+EXIF_ORIENTATIONS = {1: (0, False),
+                     2: (0, True),
+                     3: (2, False),
+                     4: (2, True),
+                     5: (1, True),
+                     6: (3, False),
+                     7: (3, True),
+                     8: (1, False)}
+
+# lossless transpose method for each orientation
+TRANSPOSE_METHODS = {(0, False): None,
+                     (1, False): Image.ROTATE_90,
+                     (2, False): Image.ROTATE_180,
+                     (3, False): Image.ROTATE_270,
+                     (0, True): Image.FLIP_LEFT_RIGHT,
+                     (1, True): Image.TRANSPOSE,
+                     (2, True): Image.FLIP_TOP_BOTTOM,
+                     (3, True): Image.TRANSVERSE}
+
+
+def __MakeLinearRamp(white):
+    # putpalette expects [r,g,b,r,g,b,...]
+    ramp = []
+    r, g, b = white
+    for i in range(256):
+        ramp.extend((r * i // 255, g * i // 255, b * i // 255))
+    return ramp
+
+
+# make sepia ramp (tweak color as necessary)
+SEPIA_PALETTE = __MakeLinearRamp((255, 240, 192))
+
+
+def GetExifOrientation(pilImg):
     exifOrient = 274
-    rotation = 0
+    orientation = 1
+    if "exif" not in pilImg.info:
+        # some formats (e.g. PNG) decode the whole image to look for EXIF
+        # data behind the image data
+        return orientation
     try:
         exif = pilImg._getexif()  # pylint: disable=protected-access
         if isinstance(exif, dict) and exifOrient in exif:
-            rotation = exif[exifOrient]
+            orientation = exif[exifOrient]
     except AttributeError:
         pass
     except Exception as err:
-        logging.debug("PILBackend.RotateExif(): %s", err, exc_info=1)
+        logging.debug("PILBackend.GetExifOrientation(): %s", err, exc_info=1)
+    return orientation
 
-    if rotation == 2:
-        # flip horizontal
-        return pilImg.transpose(Image.FLIP_LEFT_RIGHT)
-    elif rotation == 3:
-        # rotate 180
-        return pilImg.rotate(-180)
-    elif rotation == 4:
-        # flip vertical
-        return pilImg.transpose(Image.FLIP_TOP_BOTTOM)
-    elif rotation == 5:
-        # transpose
-        pilImg = pilImg.rotate(-90, expand=1)
-        return pilImg.transpose(Image.FLIP_LEFT_RIGHT)
-    elif rotation == 6:
-        # rotate 90
-        return pilImg.rotate(-90, expand=1)
-    elif rotation == 7:
-        # transverse
-        pilImg = pilImg.rotate(-90, expand=1)
-        return pilImg.transpose(Image.FLIP_TOP_BOTTOM)
-    elif rotation == 8:
-        # rotate 270
-        return pilImg.rotate(-270, expand=1)
 
-    return pilImg
+def Orientate(pilImg, exifOrientation, rotation=0):
+    '''
+    Applies the EXIF orientation and the user rotation (in clockwise quarter
+    turns) to the given image with a single lossless transposition.
+    '''
+    turns, flipped = EXIF_ORIENTATIONS.get(exifOrientation, (0, False))
+    method = TRANSPOSE_METHODS[((turns - rotation) % 4, flipped)]
+    if method is None:
+        return pilImg
+    return pilImg.transpose(method)
+
+
+def RotateExif(pilImg):
+    return Orientate(pilImg, GetExifOrientation(pilImg))
+
+
+class ImageInfo:
+    '''
+    Header information of an image file, see ProbeImage().
+    '''
+
+    def __init__(self, size=None, orientation=1, error=None, tileCount=1):
+        self.__size = size
+        self.__orientation = orientation
+        self.__error = error
+        self.__tileCount = tileCount
+
+    def IsValid(self):
+        return self.__error is None
+
+    def GetError(self):
+        return self.__error
+
+    def GetSize(self):
+        '''
+        Returns the size of the image as stored in the file.
+        '''
+        return self.__size
+
+    def GetOrientation(self):
+        '''
+        Returns the EXIF orientation tag.
+        '''
+        return self.__orientation
+
+    def GetTileCount(self):
+        '''
+        Returns the number of tiles or strips that can be decoded
+        independently, e.g. of an uncompressed TIFF image.
+        '''
+        return self.__tileCount
+
+    def GetOrientatedSize(self):
+        '''
+        Returns the size of the image after applying the EXIF orientation.
+        '''
+        width, height = self.__size
+        if EXIF_ORIENTATIONS.get(self.__orientation, (0, False))[0] % 2:
+            width, height = height, width
+        return width, height
+
+
+__PROBE_CACHE = {}
+__PROBE_LOCK = threading.Lock()
+
+
+def ProbeImage(filename):
+    '''
+    Reads the header and the EXIF data of the given image file without
+    decoding the image data. The results are cached by path, modification
+    time and file size, so probing a file again costs only a stat call.
+    :rtype: ImageInfo
+    '''
+    try:
+        stat = os.stat(filename)
+    except OSError as err:
+        return ImageInfo(error=str(err))
+
+    fileId = (stat.st_mtime, stat.st_size)
+    with __PROBE_LOCK:
+        entry = __PROBE_CACHE.get(filename)
+    if entry is not None and entry[0] == fileId:
+        return entry[1]
+
+    try:
+        with Image.open(filename) as pilImg:
+            info = ImageInfo(pilImg.size, GetExifOrientation(pilImg),
+                             tileCount=len(pilImg.tile))
+    except Exception as err:
+        logging.debug("PILBackend.ProbeImage(%s): %s", filename, err, exc_info=1)
+        info = ImageInfo(error=str(err))
+
+    with __PROBE_LOCK:
+        __PROBE_CACHE[filename] = (fileId, info)
+    return info
+
+
+def ApplyEffect(pilImg, effect):
+    '''
+    Finishes the color effect of an image that was loaded without effect
+    and returns the final RGB image. This is done on the output frame, the
+    gray scale conversion of the source was already done while loading.
+    Note: the given image gets modified.
+    '''
+    if pilImg.mode == "RGB":
+        return pilImg
+    if effect == Picture.EFFECT_SEPIA:
+        pilImg.putpalette(SEPIA_PALETTE)
+    return pilImg.convert("RGB")
 
 
 def CropAndResize(pilImg, rect, size, draft=False):
+    '''
+    Crops the given rect out of the image and scales it to size. Depending on
+    the rect a specialised kernel is used, see tools/bench_cropandresize.py:
+     - a plain crop if the rect is pixel aligned and not scaled
+     - a reduce if the rect is pixel aligned and scaled down by an integer
+       factor
+     - a reduce by the integer part of the scale factor followed by a
+       bilinear resize if the rect lies within the image and is scaled down
+       by 2 at most, with larger factors it is not faster than the affine
+       transformation
+     - the affine transformation in all other cases, e.g. if the rect exceeds
+       the image bounds or in draft mode
+    '''
+    left, top, width, height = rect
+    aligned = left == int(left) and top == int(top)
+    if (width, height) == tuple(size) and aligned:
+        left = int(left)
+        top = int(top)
+        return pilImg.crop((left, top, left + size[0], top + size[1]))
+
     if draft:
         filtr = Image.NEAREST
     else:
         filtr = Image.BILINEAR
+        inside = left >= 0 and top >= 0 and \
+            left + width <= pilImg.size[0] and \
+            top + height <= pilImg.size[1]
+        factor = width / size[0]
+        if inside and aligned and factor == int(factor) and \
+                height == size[1] * factor:
+            left = int(left)
+            top = int(top)
+            return pilImg.reduce(int(factor),
+                                 (left, top,
+                                  left + int(width), top + int(height)))
+        if inside and max(factor, height / size[1]) <= 2:
+            return pilImg.resize(size, filtr,
+                                 box=(left, top, left + width, top + height),
+                                 reducing_gap=1.0)
+
     img = pilImg.transform(size,
                            Image.AFFINE,
-                           [rect[2] / size[0], 0, rect[0],
-                            0, rect[3] / size[1], rect[1]],
+                           [width / size[0], 0, left,
+                            0, height / size[1], top],
                            filtr)
     return img
 
 
-def Transition(kind, pilImg1, pilImg2, percentage):
-    if kind == Picture.TRANS_FADE:
-        img = Image.blend(pilImg1, pilImg2, percentage)
-    elif kind == Picture.TRANS_ROLL:
-        xsize, ysize = pilImg1.size
-        delta = int(xsize * percentage)
-        part1 = pilImg2.crop((0, 0, delta, ysize))
-        part2 = pilImg1.crop((delta, 0, xsize, ysize))
-        image = pilImg2.copy()
-        image.paste(part2, (0, 0, xsize - delta, ysize))
-        image.paste(part1, (xsize - delta, 0, xsize, ysize))
-        img = image
-
+def GetImageByteSize(pilImg):
+    '''
+    Returns the memory PIL needs for the pixels of an image. Images with
+    several bands are stored with 4 bytes per pixel, RGB as well.
+    '''
+    if len(pilImg.getbands()) > 1 or pilImg.mode in ("I", "F"):
+        pixelSize = 4
+    elif pilImg.mode.startswith("I;16"):
+        pixelSize = 2
+    else:
+        pixelSize = 1
+    return pilImg.size[0] * pilImg.size[1] * pixelSize
+
+
+class ImagePyramid:
+    '''
+    Holds an image together with successively halved copies of it (mip
+    maps). Crops are sampled from the level that fits the scale factor best,
+    so the costs of a crop depend on the output size and not on the size of
+    the source image. The levels are created on demand and may be shared
+    between several threads.
+    '''
+
+    def __init__(self, pilImg):
+        self.__levels = [pilImg]
+        self.__lock = threading.Lock()
+
+    def GetImage(self):
+        return self.__levels[0]
+
+    def GetByteSize(self):
+        '''
+        Returns the memory needed by the image including all of its levels.
+        '''
+        return GetImageByteSize(self.__levels[0]) * 4 // 3
+
+    def GetLevel(self, level):
+        with self.__lock:
+            while len(self.__levels) <= level:
+                img = self.__levels[-1]
+                self.__levels.append(
+                    img.resize(((img.size[0] + 1) // 2,
+                                (img.size[1] + 1) // 2),
+                               Image.BOX))
+            return self.__levels[level]
+
+    def CropAndResize(self, rect, size, draft=False):
+        '''
+        Crops the given rect out of the image and scales it to size. In draft
+        mode the next coarser level is sampled with the nearest neighbour
+        filter, it does not alias as the level is already prefiltered.
+        '''
+        width, height = self.__levels[0].size
+        # number of source pixels per output pixel
+        factor = min(rect[2] / size[0], rect[3] / size[1])
+
+        level = 0
+        while 2 ** (level + 1) <= factor:
+            level += 1
+        if draft and 2 ** level < factor:
+            level += 1
+        while level > 0 and 2 ** level > min(width, height):
+            level -= 1
+
+        pilImg = self.GetLevel(level)
+        if level > 0:
+            ratioX = pilImg.size[0] / width
+            ratioY = pilImg.size[1] / height
+            rect = (rect[0] * ratioX, rect[1] * ratioY,
+                    rect[2] * ratioX, rect[3] * ratioY)
+        return CropAndResize(pilImg, rect, size, draft)
+
+
+class _TileImageFile(ImageFile.ImageFile):
+    '''
+    Lets PIL decode a single tile of an image file as if it was the whole
+    image, see TiledImage.
+    '''
+
+    format = "TILE"
+    format_description = "Tile of an image file"
+
+    def __init__(self, filename, mode, size, tiles):
+        '''
+        :param tiles: the entries of the tile list of PIL that cover the tile,
+                      moved to the origin
+        '''
+        self.__tileInfo = (mode, size, tiles)
+        ImageFile.ImageFile.__init__(self, filename)
+
+    def _open(self):
+        self._mode, self._size, self.tile = self.__tileInfo
+
+
+class TiledImage:
+    '''
+    Source of a huge image that is stored in tiles or strips which can be
+    decoded independently (e.g. a gigapixel TIFF). The image is never
+    decoded as a whole, a crop decodes only the tiles covering its rect.
+    Decoded tiles are kept in a LRU cache, so the following frames of a
+    movement decode only the tiles that come into view. If a crop is scaled
+    down the tiles are cached halved one or more times, like the levels of
+    an ImagePyramid.
+    '''
+
+    TILE_CACHE_SIZE = 256 * 1024 * 1024
+
+    def __init__(self, filename, exifOrientation=1, rotation=0, mode="RGB",
+                 reduction=1, maxBytes=None):
+        '''
+        :param filename: the image file to read the tiles from
+        :param exifOrientation: the EXIF orientation tag of the image
+        :param rotation: the user rotation in clockwise quarter turns
+        :param mode: the mode of the cropped images, "RGB" or "L"
+        :param reduction: the rects passed to CropAndResize() refer to the
+                          image scaled down by 1/reduction
+        :param maxBytes: memory limit of the tile cache
+        '''
+        self.__filename = filename
+        turns, flipped = EXIF_ORIENTATIONS.get(exifOrientation, (0, False))
+        self.__orientation = ((turns - rotation) % 4, flipped)
+        self.__mode = mode
+        self.__reduction = reduction
+        if maxBytes is None:
+            maxBytes = self.TILE_CACHE_SIZE
+        self.__maxBytes = maxBytes
+
+        # the tile list of PIL, tiles of planar images consist of one entry
+        # per band with the same box
+        self.__layout = collections.OrderedDict()
+        with Image.open(filename) as pilImg:
+            self.__rawSize = pilImg.size
+            self.__rawMode = pilImg.mode
+            self.__palette = pilImg.getpalette() if pilImg.mode == "P" else None
+            for tile in pilImg.tile:
+                self.__layout.setdefault(tuple(tile[1]), []).append(tile)
+
+        # tiles can be halved as long as they stay aligned to the pixels of
+        # the halved image
+        self.__maxLevel = 0
+        while all((box[0] | box[1]) % 2 ** (self.__maxLevel + 1) == 0
+                  for box in self.__layout):
+            self.__maxLevel += 1
+            if 2 ** self.__maxLevel > min(self.__rawSize):
+                self.__maxLevel -= 1
+                break
+
+        self.__tiles = collections.OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+
+    def GetSize(self):
+        '''
+        Returns the size of the full size image after applying the
+        orientation.
+        '''
+        width, height = self.__rawSize
+        if self.__orientation[0] % 2:
+            width, height = height, width
+        return width, height
+
+    def GetByteSize(self):
+        return self.__maxBytes
+
+    def __TransformBox(self, box, size, turns, flipped):
+        '''
+        Maps a box of an image with the given size to the image that results
+        from a horizontal flip followed by counterclockwise quarter turns.
+        '''
+        x0, y0, x1, y1 = box
+        width, height = size
+        if flipped:
+            x0, x1 = width - x1, width - x0
+        for _ in range(turns):
+            x0, y0, x1, y1 = y0, width - x1, y1, width - x0
+            width, height = height, width
+        return x0, y0, x1, y1
+
+    def __DecodeTile(self, box, level):
+        '''
+        Decodes a tile, errors are raised so the frame that needs it fails
+        instead of showing a black hole.
+        '''
+        width = box[2] - box[0]
+        height = box[3] - box[1]
+        tiles = [(tile[0], (0, 0, width, height)) + tuple(tile[2:])
+                 for tile in self.__layout[box]]
+        with _TileImageFile(self.__filename, self.__rawMode, (width, height),
+                            tiles) as tileImg:
+            if self.__palette is not None:
+                tileImg.putpalette(self.__palette)
+            pilImg = tileImg.convert(self.__mode)
+        if level > 0:
+            scale = 2 ** level
+            pilImg = pilImg.resize(((width + scale - 1) // scale,
+                                    (height + scale - 1) // scale),
+                                   Image.BOX)
+        return pilImg
+
+    def __GetTile(self, box, level):
+        key = (box, level)
+        with self.__lock:
+            tile = self.__tiles.get(key)
+            if tile is not None:
+                self.__tiles.move_to_end(key)
+                return tile
+
+        tile = self.__DecodeTile(box, level)
+
+        with self.__lock:
+            if key not in self.__tiles:
+                self.__tiles[key] = tile
+                self.__bytes += GetImageByteSize(tile)
+                while self.__bytes > self.__maxBytes and len(self.__tiles) > 1:
+                    _, oldTile = self.__tiles.popitem(last=False)
+                    self.__bytes -= GetImageByteSize(oldTile)
+        return tile
+
+    def GetRegion(self, box, level=0):
+        '''
+        Returns the orientated image of the given box out of the image halved
+        level times, only the tiles intersecting the box are decoded. The box
+        refers to the full size image and gets aligned to the halved pixels.
+        :returns: the image and the aligned box
+        '''
+        turns, flipped = self.__orientation
+        rawWidth, rawHeight = self.__rawSize
+        rawBox = self.__TransformBox(box, self.GetSize(),
+                                     turns if flipped else -turns % 4,
+                                     flipped)
+        scale = 2 ** level
+        rawBox = (rawBox[0] // scale * scale,
+                  rawBox[1] // scale * scale,
+                  min(rawWidth, -(-rawBox[2] // scale) * scale),
+                  min(rawHeight, -(-rawBox[3] // scale) * scale))
+
+        region = Image.new(self.__mode,
+                           (-(-(rawBox[2] - rawBox[0]) // scale),
+                            -(-(rawBox[3] - rawBox[1]) // scale)))
+        for tileBox in self.__layout:
+            if tileBox[0] < rawBox[2] and tileBox[2] > rawBox[0] and \
+                    tileBox[1] < rawBox[3] and tileBox[3] > rawBox[1]:
+                region.paste(self.__GetTile(tileBox, level),
+                             ((tileBox[0] - rawBox[0]) // scale,
+                              (tileBox[1] - rawBox[1]) // scale))
+
+        method = TRANSPOSE_METHODS[self.__orientation]
+        if method is not None:
+            region = region.transpose(method)
+        return region, self.__TransformBox(rawBox, self.__rawSize,
+                                           turns, flipped)
+
+    def CropAndResize(self, rect, size, draft=False):
+        '''
+        Crops the given rect out of the image and scales it to size. The rect
+        is cut from a region that covers it with one pixel of margin for the
+        filter. The level is chosen like in ImagePyramid.CropAndResize().
+        '''
+        width, height = self.GetSize()
+        left, top, rectWidth, rectHeight = (value * self.__reduction
+                                            for value in rect)
+        box = (max(0, int(math.floor(left)) - 1),
+               max(0, int(math.floor(top)) - 1),
+               min(width, int(math.ceil(left + rectWidth)) + 1),
+               min(height, int(math.ceil(top + rectHeight)) + 1))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return Image.new(self.__mode, size)
+
+        factor = min(rectWidth / size[0], rectHeight / size[1])
+        level = 0
+        while 2 ** (level + 1) <= factor:
+            level += 1
+        if draft and 2 ** level < factor:
+            level += 1
+        level = min(level, self.__maxLevel)
+
+        region, box = self.GetRegion(box, level)
+        ratioX = region.size[0] / (box[2] - box[0])
+        ratioY = region.size[1] / (box[3] - box[1])
+        return CropAndResize(region,
+                             ((left - box[0]) * ratioX,
+                              (top - box[1]) * ratioY,
+                              rectWidth * ratioX,
+                              rectHeight * ratioY),
+                             size, draft)
+
+
+def __TransitionFade(pilImg1, pilImg2, percentage):
+    return Image.blend(pilImg1, pilImg2, percentage)
+
+
+def __TransitionRoll(pilImg1, pilImg2, percentage):
+    xsize, ysize = pilImg1.size
+    delta = int(xsize * percentage)
+    # paste clips the parts outside of the image, so no intermediate crops
+    # are needed
+    img = Image.new(pilImg1.mode, (xsize, ysize))
+    img.paste(pilImg1, (-delta, 0))
+    img.paste(pilImg2, (xsize - delta, 0))
     return img
 
 
+TRANSITIONS = {Picture.TRANS_FADE: __TransitionFade,
+               Picture.TRANS_ROLL: __TransitionRoll}
+
+
+def Transition(kind, pilImg1, pilImg2, percentage):
+    return TRANSITIONS[kind](pilImg1, pilImg2, percentage)
+
+
 def __CreateDummyImage(message):
     width = 400
     height = 300
@@ -132,70 +591,122 @@ def __CreateDummyImage(message):
     return img
 
 
-def __GetImage(picture):
+def __GetImage(picture, reduction=1):
+    '''
+    Decodes the image of the given picture scaled down by 1/reduction. If the
+    image cannot be read a dummy image is returned.
+    :returns: the image and its EXIF orientation
+    '''
+    info = ProbeImage(picture.GetFilename())
     try:
+        if not info.IsValid():
+            raise IOError(info.GetError())
         img = Image.open(picture.GetFilename())
-        # open does not validate the image data, because it is not loaded yet
-        # use thumbnail() instead of load, it checks image data much faster
-        img.thumbnail((10, 10))
-        # discard the thumbnail
-        img = Image.open(picture.GetFilename())
+        if reduction > 1:
+            img = __ReduceImage(img, reduction)
+        # decode here, so broken image data results in a dummy image
+        img.load()
         picture.SetDummy(False)
     except Exception as err:
         logging.debug("PILBackend.GetImage(%s): %s", picture.GetFilename(), err, exc_info=1)
         img = __CreateDummyImage(str(err))
         picture.SetDummy(True)
-    return img
+    return img, info.GetOrientation()
 
 
-def __ProcessImage(img, picture):
-    if not picture.IsDummy():
-        img = RotateExif(img)
-        rotation = picture.GetRotation() * -90
-        if rotation != 0:
-            img = img.rotate(rotation)
+def __GetProcessMode(picture):
+    if picture.GetEffect() in (Picture.EFFECT_BLACK_WHITE,
+                               Picture.EFFECT_SEPIA):
+        # all color effects work on the gray scale image
+        return "L"
+    return "RGB"
 
-    if picture.GetEffect() == picture.EFFECT_BLACK_WHITE:
-        img = img.convert("L")
 
-    elif picture.GetEffect() == picture.EFFECT_SEPIA:
+def __ProcessImage(img, picture, exifOrientation, withEffect=True):
+    if not picture.IsDummy():
+        img = Orientate(img, exifOrientation, picture.GetRotation())
+
+    img = img.convert(__GetProcessMode(picture))
 
-        def make_linear_ramp(white):
-            # putpalette expects [r,g,b,r,g,b,...]
-            ramp = []
-            r, g, b = white
-            for i in range(255):
-                ramp.extend((r * i // 255, g * i // 255, b * i // 255))
-            return ramp
+    if withEffect:
+        img = ApplyEffect(img, picture.GetEffect())
+    return img
 
-        # make sepia ramp (tweak color as necessary)
-        sepia = make_linear_ramp((255, 240, 192))
-        img = img.convert("L")
-        img.putpalette(sepia)
 
-    return img.convert("RGB")
+def __ReduceImage(pilImg, reduction):
+    '''
+    Scales down the given image by the factor 1/reduction. Must be called
+    before the image data is loaded. JPEG images are decoded directly at the
+    reduced scale using the DCT scaling of libjpeg, all other formats are
+    loaded at full size and box filtered.
+    '''
+    width, height = pilImg.size
+    # libjpeg chooses the largest scale 1/1, 1/2, 1/4 or 1/8 that still
+    # covers the requested size, so request the truncated size to get exactly
+    # the wanted reduction
+    pilImg.draft(pilImg.mode, (max(1, width // reduction),
+                               max(1, height // reduction)))
+    if pilImg.size == (width, height):
+        # draft not supported, use the same rounding as libjpeg
+        pilImg = pilImg.resize(((width + reduction - 1) // reduction,
+                                (height + reduction - 1) // reduction),
+                               Image.BOX)
+    return pilImg
 
 
-def GetImage(picture):
-    pilImg = __GetImage(picture)
-    pilImg = __ProcessImage(pilImg, picture)
-    picture.SetWidth(pilImg.size[0])
-    picture.SetHeight(pilImg.size[1])
+def GetImage(picture, reduction=1, withEffect=True):
+    '''
+    Loads and processes the image of the given picture.
+    :param picture: the picture to load
+    :param reduction: one of 1, 2, 4 or 8, the loaded image is scaled down
+                      by 1/reduction
+    :param withEffect: if False the color effect is not finished, the result
+                       must be passed to ApplyEffect(), e.g. after it was
+                       cropped and resized
+    '''
+    pilImg, exifOrientation = __GetImage(picture, reduction)
+    pilImg = __ProcessImage(pilImg, picture, exifOrientation, withEffect)
+    if reduction == 1:
+        # dimension of a reduced image is not the real dimension of the picture
+        picture.SetWidth(pilImg.size[0])
+        picture.SetHeight(pilImg.size[1])
     return pilImg
 
 
-def GetExifRotation(pilImg):
-    exifOrient = 274
-    rotation = 0
-    try:
-        exif = pilImg._getexif()  # pylint: disable=protected-access
-        if isinstance(exif, dict) and exifOrient in exif:
-            rotation = exif[exifOrient]
-    except AttributeError:
-        pass
-    except Exception as err:
-        logging.debug("PILBackend.RotateExif(): %s", err, exc_info=1)
+# images with more pixels are loaded tile by tile if they are stored in tiles
+TILED_MIN_PIXELS = 100 * 1000 * 1000
+
+
+def GetSourceImage(picture, reduction=1):
+    '''
+    Loads the image of the given picture as source for cropping frames
+    without finishing the color effect, see ApplyEffect(). Huge images that
+    are stored in independent tiles or strips are not decoded at once but
+    tile by tile on demand.
+    :param picture: the picture to load
+    :param reduction: one of 1, 2, 4 or 8, the rects to crop refer to the
+                      image scaled down by 1/reduction
+    :rtype: ImagePyramid or TiledImage
+    '''
+    info = ProbeImage(picture.GetFilename())
+    if info.IsValid() and info.GetTileCount() > 1:
+        width, height = info.GetSize()
+        if width * height >= TILED_MIN_PIXELS:
+            tiledImg = TiledImage(picture.GetFilename(),
+                                  info.GetOrientation(),
+                                  picture.GetRotation(),
+                                  __GetProcessMode(picture),
+                                  reduction)
+            picture.SetDummy(False)
+            picture.SetWidth(tiledImg.GetSize()[0])
+            picture.SetHeight(tiledImg.GetSize()[1])
+            return tiledImg
+
+    return ImagePyramid(GetImage(picture, reduction, False))
+
 
+def GetExifRotation(pilImg):
+    rotation = GetExifOrientation(pilImg)
     if rotation == 3:
         # rotate 180
         return 2
@@ -216,19 +727,14 @@ def GetExifRotation(pilImg):
 
 
 def GetImageSize(filename):
-    pilImg = Image.open(filename)
-    width, height = pilImg.size
-    rotation = GetExifRotation(pilImg)
-    while rotation > 0:
-        width, height = height, width
-        rotation -= 1
-    return width, height
+    info = ProbeImage(filename)
+    if not info.IsValid():
+        raise IOError(info.GetError())
+    return info.GetOrientatedSize()
 
 
-def GetThumbnail(picture, width=None, height=None):
-    img = __GetImage(picture)
-
-    aspect = img.size[0] / img.size[1]
+def __GetThumbnailSize(size, width, height):
+    aspect = size[0] / size[1]
     if width is not None and height is not None:
         thumbWidth = width
         thumbHeight = height
@@ -238,10 +744,25 @@ def GetThumbnail(picture, width=None, height=None):
     elif height is not None:
         thumbHeight = height
         thumbWidth = int(round(thumbHeight * aspect))
+    return thumbWidth, thumbHeight
+
+
+def GetThumbnail(picture, width=None, height=None):
+    reduction = 1
+    info = ProbeImage(picture.GetFilename())
+    if info.IsValid():
+        # decode at the smallest scale that still covers the thumbnail
+        thumbMax = max(__GetThumbnailSize(info.GetSize(), width, height))
+        while reduction < 8 and \
+                max(info.GetSize()) // (reduction * 2) >= thumbMax:
+            reduction *= 2
+
+    img, exifOrientation = __GetImage(picture, reduction)
+    thumbWidth, thumbHeight = __GetThumbnailSize(img.size, width, height)
 
     # prescale image to speed up processing
     img.thumbnail((max(thumbWidth, thumbHeight), max(thumbWidth, thumbHeight)), Image.NEAREST)
-    img = __ProcessImage(img, picture)
+    img = __ProcessImage(img, picture, exifOrientation)
 
     # make the real thumbnail
     img.thumbnail((thumbWidth, thumbHeight), Image.NEAREST)
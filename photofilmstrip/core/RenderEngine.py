@@ -19,9 +19,14 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+from array import array
+import bisect
+import math
 import os
 
-from photofilmstrip.core.tasks import TaskCropResize, TaskTrans, TaskSubtitle
+from photofilmstrip.core.tasks import (
+    TaskSubtitle, TaskLoadPic, TaskCropResize, TaskTrans)
+from photofilmstrip.core.FramePlan import FramePlan
 from photofilmstrip.core.Picture import Picture
 from photofilmstrip.core.PicturePattern import PicturePattern
 from photofilmstrip.core.exceptions import RenderException
@@ -34,15 +39,237 @@ class RenderEngine:
         self._profile = profile
         self._pics = pics
         self._draftMode = draftMode
+        self._plan = None
+        self._segments = None
+        self._segmentStarts = None
+        self._frameRanges = None
+
+    def _PlanFrames(self, pics, plan):
+        '''
+        Adds the frames for the given pictures to the plan.
+        :param plan: a FramePlan instance
+        '''
+        raise NotImplementedError()
 
-        self._tasks = []
+    def _GenerateTasks(self):
+        '''
+        Yields the tasks in the order of the frames. They are created segment
+        by segment, so no frames are planned ahead.
+        '''
+        resolution = self._profile.GetResolution()
+        segments = self.__GetSegments()
+        for firstFrame, endFrame in self.GetFrameRanges():
+            idxSegment = bisect.bisect_right(self._segmentStarts, firstFrame) - 1
+            while firstFrame < endFrame:
+                segment = segments[idxSegment]
+                stopFrame = min(endFrame,
+                                segment.firstFrame + segment.frameCount)
+                for task in self._IterSegmentTasks(
+                        segment, firstFrame - segment.firstFrame,
+                        stopFrame - segment.firstFrame, resolution):
+                    task.SetDraft(self._draftMode)
+                    yield task
+                firstFrame = stopFrame
+                idxSegment += 1
+
+    def _GetTaskCount(self):
+        return sum(endFrame - firstFrame
+                   for firstFrame, endFrame in self.GetFrameRanges())
+
+    def _GetSegments(self, pics):
+        '''
+        Returns a list of FrameSegment instances that cover all frames in
+        their order. Must not compute the rects of the frames.
+        '''
+        raise NotImplementedError()
 
-    def _PrepareTasks(self, pics):
+    def _CreateFrameTask(self, segment, idx, resolution):
+        '''
+        Creates the task for a single frame of a segment.
+        :param idx: the index of the frame within the segment
+        '''
         raise NotImplementedError()
 
+    def _IterSegmentTasks(self, segment, firstIdx, endIdx, resolution):
+        '''
+        Yields the tasks for the frames firstIdx up to but not including
+        endIdx of a segment.
+        '''
+        for idx in range(firstIdx, endIdx):
+            yield self._CreateFrameTask(segment, idx, resolution)
+
+    def _GetReduction(self, pathRects, resolution=None):
+        '''
+        Returns the largest reduction (1, 2, 4 or 8) a picture can be loaded
+        with, while every rect of its path still gets at least one source
+        pixel per output pixel.
+        :param pathRects: the rects of the picture's path in full resolution
+        :param resolution: the output resolution, defaults to the profile's
+        '''
+        if resolution is None:
+            resolution = self._profile.GetResolution()
+        resWidth, resHeight = resolution
+        scale = 0
+        for rect in pathRects:
+            if rect[2] > 0 and rect[3] > 0:
+                scale = max(scale, resWidth / rect[2], resHeight / rect[3])
+
+        reduction = 1
+        while reduction < 8 and reduction * 2 * scale <= 1:
+            reduction *= 2
+        return reduction
+
+    def _GetPathReduction(self, path, resolution=None):
+        '''
+        Returns the reduction for a ComputePath without computing all rects.
+        The movements are monotonic, so the smallest rect is the first or
+        the last one.
+        '''
+        return self._GetReduction(
+            (path.GetRect(0), path.GetRect(path.GetStepCount() - 1)),
+            resolution)
+
+    def __GetSegments(self):
+        if self._segments is None:
+            self._segments = self._GetSegments(self._pics)
+            self._segmentStarts = [segment.firstFrame
+                                   for segment in self._segments]
+        return self._segments
+
+    def GetSegments(self):
+        '''
+        Returns the FrameSegment instances of all frames in their order.
+        '''
+        return self.__GetSegments()
+
+    def GetFrameCount(self):
+        '''
+        Returns the number of frames without planning them.
+        '''
+        segments = self.__GetSegments()
+        if not segments:
+            return 0
+        return segments[-1].firstFrame + segments[-1].frameCount
+
+    def GetFrameIndex(self, seconds):
+        '''
+        Returns the index of the frame that is shown at the given time.
+        '''
+        idx = int(seconds * self._profile.GetFrameRate().AsFloat())
+        return min(max(idx, 0), max(self.GetFrameCount() - 1, 0))
+
+    def GetFrameTask(self, idx, resolution=None):
+        '''
+        Creates the task for a single frame without planning the others.
+        The frame is looked up by bisection over the segments, its rects are
+        computed in closed form.
+        :param idx: the index of the frame
+        :param resolution: the output resolution, defaults to the profile's
+        '''
+        if idx < 0 or idx >= self.GetFrameCount():
+            raise IndexError("frame index out of range: %s" % idx)
+        if resolution is None:
+            resolution = self._profile.GetResolution()
+        segment = self._segments[
+            bisect.bisect_right(self._segmentStarts, idx) - 1]
+        task = self._CreateFrameTask(segment, idx - segment.firstFrame,
+                                     resolution)
+        task.SetDraft(self._draftMode)
+        return task
+
+    def RenderFrame(self, idx, resolution=None):
+        '''
+        Renders a single frame, e.g. for poster frames or previews.
+        :returns: a PIL image
+        '''
+        task = self.GetFrameTask(idx, resolution)
+        return task.Run(FrameContext())
+
+    def SetFrameRange(self, firstFrame=0, endFrame=None):
+        '''
+        Restricts the tasks to a range of frames for a partial render. The
+        frames are the same as in a full render.
+        :param firstFrame: the index of the first frame to render
+        :param endFrame: the index of the frame after the last frame to
+                         render, None for all frames up to the end
+        '''
+        frameCount = self.GetFrameCount()
+        if endFrame is None or endFrame > frameCount:
+            endFrame = frameCount
+        firstFrame = max(firstFrame, 0)
+        if firstFrame >= endFrame:
+            raise RenderException(
+                _(u"The frame range %d-%d is empty, the project has %d frames!")
+                % (firstFrame, endFrame, frameCount))
+        self._frameRanges = [(firstFrame, endFrame)]
+
+    def SetFrameRanges(self, frameRanges):
+        '''
+        Restricts the tasks to several ranges of frames, e.g. the segments
+        that are missing in a SegmentCache.
+        :param frameRanges: a sorted list of (firstFrame, endFrame) tuples
+        '''
+        self._frameRanges = list(frameRanges)
+
+    def GetFrameRanges(self):
+        if self._frameRanges is None:
+            return [(0, self.GetFrameCount())]
+        return self._frameRanges
+
+    def GetFrameRange(self):
+        '''
+        Returns the index of the first frame and the index after the last
+        frame that are rendered.
+        '''
+        frameRanges = self.GetFrameRanges()
+        if not frameRanges:
+            return 0, 0
+        return frameRanges[0][0], frameRanges[-1][1]
+
+    def GetFramePlan(self):
+        '''
+        Returns the FramePlan with all frames, it is created on first access.
+        A render does not need it, see IterTasks().
+        '''
+        if self._plan is None:
+            plan = FramePlan(self._profile.GetResolution(), self._draftMode)
+            self._PlanFrames(self._pics, plan)
+            self._plan = plan
+        return self._plan
+
+    def GetTaskCount(self):
+        '''
+        Returns the number of tasks without creating them.
+        '''
+        return self._GetTaskCount()
+
+    def IterTasks(self):
+        '''
+        Returns a generator that creates the tasks on demand, so a render
+        job only holds the tasks it is currently working on.
+        '''
+        return self._GenerateTasks()
+
+    def IterSourceTasks(self):
+        '''
+        Returns a generator of the TaskLoadPic of the pictures in the order
+        they are needed by IterTasks(), e.g. to decode them ahead. The order
+        is taken from a second task generator as far as it is consumed. A
+        picture that is shown again later is listed again.
+        '''
+        keysBefore = set()
+        for task in self._GenerateTasks():
+            keys = set()
+            for subTask in task.IterSubTasks():
+                if isinstance(subTask, TaskLoadPic):
+                    key = subTask.GetKey()
+                    if key not in keysBefore and key not in keys:
+                        yield subTask
+                    keys.add(key)
+            keysBefore = keys
+
     def GetTasks(self):
-        self._PrepareTasks(self._pics)
-        return self._tasks
+        return list(self.IterTasks())
 
 
 class RenderEngineSlideshow(RenderEngine):
@@ -85,34 +312,37 @@ class RenderEngineSlideshow(RenderEngine):
                          fr * \
                          self.__picCountFactor))
 
-    def __TransAndFinal(self, infoText, trans,
-                        picFrom, picTo,
-                        pathRectsFrom, pathRectsTo):
+    def __PlanTransition(self, plan, infoText, trans,
+                         sourceFrom, sourceTo,
+                         pathRectsFrom, pathRectsTo):
         if len(pathRectsFrom) != len(pathRectsTo):
             raise RuntimeError()
 
         count = len(pathRectsFrom)
         for idx in range(count):
-            task = TaskTrans(trans, idx / count,
-                             picFrom.Copy(), pathRectsFrom[idx],
-                             picTo.Copy(), pathRectsTo[idx],
-                             self._profile.GetResolution())
-            task.SetInfo(infoText)
-            task.SetDraft(self._draftMode)
-            self._tasks.append(task)
+            plan.AddTransition(infoText, trans, idx / count,
+                               sourceFrom, pathRectsFrom[idx],
+                               sourceTo, pathRectsTo[idx])
 
-        return True
-
-    def _PrepareTasks(self, pics):
-        self.__picCountFactor = self.__GetPicCountFactor(pics)
+    def _GetTaskCount(self):
+        # one for the subtitle task
+        return 1 + RenderEngine._GetTaskCount(self)
 
+    def _GenerateTasks(self):
+        # the segments compute the picture count factor
+        self.GetSegments()
         taskSub = TaskSubtitle(self._outputPath,
                                self.__picCountFactor,
-                               pics)
-        self._tasks.append(taskSub)
+                               self._pics)
+        yield taskSub
+
+        yield from RenderEngine._GenerateTasks(self)
+
+    def _PlanFrames(self, pics, plan):
+        self.__picCountFactor = self.__GetPicCountFactor(pics)
 
         pathRectsBefore = []
-        picBefore = None
+        sourceBefore = None
         transCountBefore = 0
 
         for idxPic, pic in enumerate(pics):
@@ -124,6 +354,7 @@ class RenderEngineSlideshow(RenderEngine):
 
             cp = ComputePath(pic, picCount + transCount + transCountBefore)
             pathRects = cp.GetPathRects()
+            source = plan.AddSource(pic.Copy(), self._GetReduction(pathRects))
 
             if idxPic > 0 and idxPic < len(pics):
                 # first and last pic has no transition
@@ -132,11 +363,10 @@ class RenderEngineSlideshow(RenderEngine):
                 if transCountBefore > 0:
                     phase2a = pathRectsBefore[-transCountBefore:]
                     phase2b = pathRects[:transCountBefore]
-                    if not self.__TransAndFinal(infoText,
-                                                pics[idxPic - 1].GetTransition(),
-                                                picBefore, pic,
-                                                phase2a, phase2b):
-                        break
+                    self.__PlanTransition(plan, infoText,
+                                          pics[idxPic - 1].GetTransition(),
+                                          sourceBefore, source,
+                                          phase2a, phase2b)
 
             infoText = _(u"processing image %d/%d") % (idxPic + 1, len(pics))
 
@@ -147,28 +377,98 @@ class RenderEngineSlideshow(RenderEngine):
                 # transition needs no pictures, use them all for movement
                 _pathRects = pathRects[transCountBefore:]
 
-            for rect in _pathRects:
-                task = TaskCropResize(pic.Copy(), rect,
-                                      self._profile.GetResolution())
-                task.SetInfo(infoText)
-                task.SetDraft(self._draftMode)
-                self._tasks.append(task)
+            plan.AddFrames(infoText, source, _pathRects)
 
-            picBefore = pic
+            sourceBefore = source
             pathRectsBefore = pathRects
             transCountBefore = transCount
 
 
-class RenderEngineTimelapse(RenderEngine):
+    def _GetSegments(self, pics):
+        self.__picCountFactor = self.__GetPicCountFactor(pics)
+
+        segments = []
+        firstFrame = 0
+        segmentBefore = None
+        transCountBefore = 0
+        for idxPic, pic in enumerate(pics):
+            picCount = self.__GetPicCount(pic)
+            transCount = 0
+            if idxPic < (len(pics) - 1):
+                # last pic has no transition
+                transCount = self.__GetTransCount(pic)
 
-    def _PrepareTasks(self, pics):
-        picBefore = None
+            stepCount = picCount + transCount + transCountBefore
+            cp = ComputePath(pic, stepCount)
+            picCopy = pic.Copy()
+
+            if transCountBefore > 0:
+                segment = FrameSegment(
+                    firstFrame, transCountBefore,
+                    _(u"processing transition %d/%d") % (idxPic + 1, len(pics)),
+                    picCopy, cp, 0)
+                segment.SetTransition(pics[idxPic - 1].GetTransition(),
+                                      segmentBefore.picture,
+                                      segmentBefore.path,
+                                      segmentBefore.path.GetStepCount() - transCountBefore)
+                segments.append(segment)
+                firstFrame += transCountBefore
+
+            segment = FrameSegment(
+                firstFrame, picCount,
+                _(u"processing image %d/%d") % (idxPic + 1, len(pics)),
+                picCopy, cp, transCountBefore)
+            segments.append(segment)
+            firstFrame += picCount
+
+            segmentBefore = segment
+            transCountBefore = transCount
+        return segments
+
+    def _IterSegmentTasks(self, segment, firstIdx, endIdx, resolution):
+        if segment.pictureFrom is not None:
+            yield from RenderEngine._IterSegmentTasks(self, segment, firstIdx,
+                                                      endIdx, resolution)
+            return
+
+        # visually identical rects of a movement share their task key like
+        # in the FramePlan, the merging starts at the segment's first frame
+        reduction = self._GetPathReduction(segment.path, resolution)
+        rects = (segment.path.GetRect(segment.firstStep + idx)
+                 for idx in range(endIdx))
+        for idx, rect in enumerate(FramePlan.IterMergedRects(rects,
+                                                             resolution)):
+            if idx < firstIdx:
+                continue
+            task = TaskCropResize(segment.picture, rect, resolution, reduction)
+            task.SetInfo(segment.infoText)
+            yield task
+
+    def _CreateFrameTask(self, segment, idx, resolution):
+        task = TaskCropResize(segment.picture,
+                              segment.path.GetRect(segment.firstStep + idx),
+                              resolution,
+                              self._GetPathReduction(segment.path, resolution))
+        if segment.pictureFrom is not None:
+            taskFrom = TaskCropResize(
+                segment.pictureFrom,
+                segment.pathFrom.GetRect(segment.firstStepFrom + idx),
+                resolution,
+                self._GetPathReduction(segment.pathFrom, resolution))
+            task = TaskTrans(segment.transKind, idx / segment.frameCount,
+                             taskFrom, task, resolution)
+        task.SetInfo(segment.infoText)
+        return task
 
-        picNum = None
 
-        idxPic = 0
-        while idxPic < len(pics):
-            pic = pics[idxPic]
+class RenderEngineTimelapse(RenderEngine):
+
+    def __IterSequences(self, pics):
+        '''
+        Yields the pictures that start a sequence together with their pattern
+        and the number of pictures in the sequence.
+        '''
+        for idxPic, pic in enumerate(pics):
             picPattern = PicturePattern.Create(pic.GetFilename())
             if not picPattern.IsOk():
                 raise RenderException(
@@ -176,18 +476,14 @@ class RenderEngineTimelapse(RenderEngine):
                      u"which is necessary for a time lapse "
                      u"slide show!") % pic.GetFilename())
 
-            picNum = picPattern.num
-            picDur = int(pic.GetDuration())
-            transDur = int(pic.GetTransitionDuration())
             if idxPic < (len(pics) - 1):
                 # get number from next pic
                 nextPic = pics[idxPic + 1]
                 nextPicPattern = PicturePattern.Create(nextPic.GetFilename())
                 if not nextPicPattern.IsOk():
-                    idxPic += 1
                     continue
 
-                picCount = nextPicPattern.num - picNum + 1
+                picCount = nextPicPattern.num - picPattern.num + 1
                 if picCount < 0:
                     raise RenderException(
                         (u"The picture counter is not "
@@ -196,43 +492,94 @@ class RenderEngineTimelapse(RenderEngine):
                 # no next pic so add the final image
                 picCount = 1
 
-            cp = ComputePath(pic, (picDur * picCount) + (transDur * (picCount - 1)))
+            yield pic, picPattern, picCount
+
+    def __GetFrameCount(self, pic, picCount):
+        picDur = int(pic.GetDuration())
+        transDur = int(pic.GetTransitionDuration())
+        return (picDur * picCount) + (transDur * (picCount - 1))
+
+    def __GetSequencePicture(self, pic, picPattern, picNum):
+        picCopy = pic.Copy()
+        picCopy._filename = os.path.join(
+            os.path.dirname(pic.GetFilename()),
+            "{0}{1}{2}".format(picPattern.prefix,
+                               ("%%0%dd" % picPattern.digits) % picNum,
+                               picPattern.postfix))
+        return picCopy
+
+    def _GetSegments(self, pics):
+        segments = []
+        firstFrame = 0
+        for pic, __, picCount in self.__IterSequences(pics):
+            frameCount = self.__GetFrameCount(pic, picCount)
+            segments.append(FrameSegment(firstFrame, frameCount, None,
+                                         pic, ComputePath(pic, frameCount)))
+            firstFrame += frameCount
+        return segments
+
+    def _CreateFrameTask(self, segment, idx, resolution):
+        pic = segment.picture
+        picPattern = PicturePattern.Create(pic.GetFilename())
+        picDur = int(pic.GetDuration())
+        transDur = int(pic.GetTransitionDuration())
+
+        # the first picture of a sequence has no transition
+        if idx < picDur:
+            picOffset, idxInPic = 0, idx + transDur
+        else:
+            picOffset, idxInPic = divmod(idx - picDur, transDur + picDur)
+            picOffset += 1
+        picNum = picPattern.num + picOffset
+
+        rect = segment.path.GetRect(idx)
+        reduction = self._GetPathReduction(segment.path, resolution)
+        task = TaskCropResize(
+            self.__GetSequencePicture(pic, picPattern, picNum),
+            rect, resolution, reduction)
+        if idxInPic < transDur:
+            taskFrom = TaskCropResize(
+                self.__GetSequencePicture(pic, picPattern, picNum - 1),
+                rect, resolution, reduction)
+            task = TaskTrans(pic.GetTransition(),
+                             (idxInPic + 1) / (transDur + 1),
+                             taskFrom, task, resolution)
+            task.SetInfo(_(u"processing transition %d/%d") % (picNum, idxInPic + 1))
+        else:
+            task.SetInfo(_(u"processing image %d/%d") % (picNum, idxInPic - transDur + 1))
+        return task
+
+    def _PlanFrames(self, pics, plan):
+        for pic, picPattern, picCount in self.__IterSequences(pics):
+            sourceBefore = None
+            picNum = picPattern.num
+            picDur = int(pic.GetDuration())
+            transDur = int(pic.GetTransitionDuration())
+
+            cp = ComputePath(pic, self.__GetFrameCount(pic, picCount))
             pathRects = cp.GetPathRects()
+            reduction = self._GetReduction(pathRects)
 
-            picDir = os.path.dirname(pic.GetFilename())
             idxRect = 0
             while idxRect < len(pathRects):
-                picCopy = pic.Copy()
-                picCopy._filename = os.path.join(
-                    picDir,
-                    "{0}{1}{2}".format(picPattern.prefix,
-                                       ("%%0%dd" % picPattern.digits) % picNum,
-                                       picPattern.postfix))
-
-                if transDur > 0 and picBefore:
+                picCopy = self.__GetSequencePicture(pic, picPattern, picNum)
+                source = plan.AddSource(picCopy, reduction)
+
+                if transDur > 0 and sourceBefore is not None:
                     for idxTrans in range(transDur):
-                        task = TaskTrans(pic.GetTransition(), (idxTrans + 1) / (transDur + 1),
-                                         picBefore.Copy(), pathRects[idxRect],
-                                         picCopy.Copy(), pathRects[idxRect],
-                                         self._profile.GetResolution())
-                        task.SetInfo(_(u"processing transition %d/%d") % (picNum, idxTrans + 1))
-                        task.SetDraft(self._draftMode)
-                        self._tasks.append(task)
+                        plan.AddTransition(_(u"processing transition %d/%d") % (picNum, idxTrans + 1),
+                                           pic.GetTransition(), (idxTrans + 1) / (transDur + 1),
+                                           sourceBefore, pathRects[idxRect],
+                                           source, pathRects[idxRect])
                         idxRect += 1
 
                 for __ in range(picDur):
-                    task = TaskCropResize(picCopy.Copy(), pathRects[idxRect],
-                                          self._profile.GetResolution())
-                    task.SetInfo(_(u"processing image %d/%d") % (picNum, __ + 1))
-                    task.SetDraft(self._draftMode)
-                    self._tasks.append(task)
+                    plan.AddFrame(_(u"processing image %d/%d") % (picNum, __ + 1),
+                                  source, pathRects[idxRect])
                     idxRect += 1
 
                 picNum += 1
-                picBefore = picCopy
-
-            picBefore = None
-            idxPic += 1
+                sourceBefore = source
 
 
 class ComputePath:
@@ -250,43 +597,123 @@ class ComputePath:
         cx2 = (w2 / 2.0) + px2
         cy2 = (h2 / 2.0) + py2
 
-        if pic.GetMovement() == Picture.MOVE_LINEAR:
-            clazz = LinearMovement
-        elif pic.GetMovement() == Picture.MOVE_DELAYED:
-            clazz = DelayedMovement
-        else:
-            clazz = AccelMovement
-        mX = clazz(cx2 - cx1, picCount, cx1)
-        mY = clazz(cy2 - cy1, picCount, cy1)
-        mW = clazz(w2 - w1, picCount, w1)
-        mH = clazz(h2 - h1, picCount, h1)
-
-        pathRects = []
-        for step in range(picCount):
-            px = mX.Get(step)
-            py = mY.Get(step)
-            width = mW.Get(step)
-            height = mH.Get(step)
-
-            rect = (px - width / 2.0,
-                    py - height / 2.0,
-                    width,
-                    height)
-
-            pathRects.append(rect)
-        self.pathRects = pathRects
+        clazz = MOVEMENTS.get(pic.GetMovement(), AccelMovement)
+        self.__mX = clazz(cx2 - cx1, picCount, cx1)
+        self.__mY = clazz(cy2 - cy1, picCount, cy1)
+        self.__mW = clazz(w2 - w1, picCount, w1)
+        self.__mH = clazz(h2 - h1, picCount, h1)
+        self.__picCount = picCount
+        self.__key = (clazz.__name__,
+                      tuple(pic.GetStartRect()), tuple(pic.GetTargetRect()),
+                      picCount)
+        self.pathRects = None
 
     def GetPathRects(self):
+        if self.pathRects is None:
+            steps = range(self.__picCount)
+            self.pathRects = [(px - width / 2.0,
+                               py - height / 2.0,
+                               width,
+                               height)
+                              for px, py, width, height in zip(
+                                  self.__mX.GetRange(steps),
+                                  self.__mY.GetRange(steps),
+                                  self.__mW.GetRange(steps),
+                                  self.__mH.GetRange(steps))]
         return self.pathRects
 
-
-class LinearMovement:
+    def GetStepCount(self):
+        return self.__picCount
+
+    def GetKey(self):
+        '''
+        Returns a tuple that describes all rects of the path.
+        '''
+        return self.__key
+
+    def GetRect(self, step):
+        '''
+        Returns the rect of a single step without computing the whole path.
+        '''
+        px = self.__mX.Get(step)
+        py = self.__mY.Get(step)
+        width = self.__mW.Get(step)
+        height = self.__mH.Get(step)
+        return (px - width / 2.0,
+                py - height / 2.0,
+                width,
+                height)
+
+
+class FrameSegment:
+    '''
+    A run of frames that shows one picture or one transition. The segments
+    map a frame index to its picture(s) and path(s) without planning all
+    frames.
+    '''
+
+    __slots__ = ("firstFrame", "frameCount", "infoText",
+                 "picture", "path", "firstStep",
+                 "transKind", "pictureFrom", "pathFrom", "firstStepFrom")
+
+    def __init__(self, firstFrame, frameCount, infoText,
+                 picture, path, firstStep=0):
+        '''
+        :param firstStep: the step of the path that is shown by the first
+                          frame of the segment
+        '''
+        self.firstFrame = firstFrame
+        self.frameCount = frameCount
+        self.infoText = infoText
+        self.picture = picture
+        self.path = path
+        self.firstStep = firstStep
+        self.transKind = None
+        self.pictureFrom = None
+        self.pathFrom = None
+        self.firstStepFrom = 0
+
+    def SetTransition(self, kind, pictureFrom, pathFrom, firstStepFrom):
+        self.transKind = kind
+        self.pictureFrom = pictureFrom
+        self.pathFrom = pathFrom
+        self.firstStepFrom = firstStepFrom
+
+
+class FrameContext:
+    '''
+    Minimal job context to run the task of a single frame outside of a
+    RenderJob, sub tasks are processed directly.
+    '''
+
+    def ProcessSubTask(self, task):
+        return task.Run(self)
+
+
+class Movement:
+    '''
+    A movement from s0 by s in t steps. Get() returns the position of a single
+    step, GetRange() the positions of many steps at once. Both are closed-form
+    so the steps can be accessed in any order.
+    '''
 
     def __init__(self, s, t, s0):
         self._s = float(s)
         self._t = float(t)
         self._s0 = float(s0)
 
+    def Get(self, t):
+        raise NotImplementedError()
+
+    def GetRange(self, steps):
+        return array('d', map(self.Get, steps))
+
+
+class LinearMovement(Movement):
+
+    def __init__(self, s, t, s0):
+        Movement.__init__(self, s, t, s0)
+
         if t > 1:
             self._v = self._s / (self._t - 1)
         else:
@@ -297,13 +724,16 @@ class LinearMovement:
         t = float(t)
         return self._v * t + self._s0
 
+    def GetRange(self, steps):
+        v = self._v
+        s0 = self._s0
+        return array('d', [v * t + s0 for t in steps])
 
-class AccelMovement:
+
+class AccelMovement(Movement):
 
     def __init__(self, s, t, s0):
-        self._s = float(s)
-        self._t = float(t)
-        self._s0 = float(s0)
+        Movement.__init__(self, s, t, s0)
 
         # gesucht: Polynom 3ten Grades
         # s = a*t^3 + b*t^2 + c*t + d
@@ -320,18 +750,45 @@ class AccelMovement:
     def Get(self, t):
         return self._a * t ** 3 + self._b * t ** 2 + self._c * t + self._d
 
+    def GetRange(self, steps):
+        a, b, c, d = self._a, self._b, self._c, self._d
+        return array('d', [a * t ** 3 + b * t ** 2 + c * t + d for t in steps])
+
 
 class DelayedMovement(AccelMovement):
+    '''
+    Holds the start position for the first quarter, accelerates in the
+    middle and holds the position of the last step in the middle for the
+    last quarter.
+    '''
 
     def __init__(self, s, t, s0):
         AccelMovement.__init__(self, s, t / 2, s0)
         self._t4th = t / 4
-        self._sAccel = None
+        self._tEnd = (self._t * 2) - self._t4th
+        # the last step that still moves
+        self._tLast = math.ceil(self._tEnd) - 1
 
     def Get(self, t):
+        if t >= self._tEnd:
+            t = self._tLast
         if t < self._t4th:
-            self._sAccel = self._s0
-        elif t < (self._t * 2) - self._t4th:
-            self._sAccel = AccelMovement.Get(self, t - self._t4th)
-        return self._sAccel
-
+            return self._s0
+        return AccelMovement.Get(self, t - self._t4th)
+
+    def GetRange(self, steps):
+        a, b, c, d = self._a, self._b, self._c, self._d
+        s0 = self._s0
+        t4th = self._t4th
+        tEnd = self._tEnd
+        tLast = self._tLast
+        steps = [tLast if t >= tEnd else t for t in steps]
+        return array('d', [s0 if t < t4th else
+                           a * (t - t4th) ** 3 + b * (t - t4th) ** 2 +
+                           c * (t - t4th) + d
+                           for t in steps])
+
+
+MOVEMENTS = {Picture.MOVE_LINEAR: LinearMovement,
+             Picture.MOVE_ACCEL: AccelMovement,
+             Picture.MOVE_DELAYED: DelayedMovement}
@@ -19,59 +19,348 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import collections
 import logging
+import queue
 import threading
+import time
 
+from PIL import Image
+
+from photofilmstrip.core import PILBackend, RenderProcess
+from photofilmstrip.core.exceptions import RenderException
+from photofilmstrip.core.tasks import TaskLoadPic, TaskImaging
 from photofilmstrip.lib.jobimpl.VisualJob import VisualJob
-from photofilmstrip.lib.jobimpl.Worker import JobAbortedException
+from photofilmstrip.lib.jobimpl.Worker import JobAbortedException, \
+    GetCurrentProcess
 from photofilmstrip.lib.jobimpl.WorkLoad import WorkLoad
+from photofilmstrip.lib.util import GetAvailableMemory
 
 
 class RenderJob(VisualJob):
 
-    def __init__(self, name, renderer, tasks):
-        VisualJob.__init__(self, name, groupId="render")
-        self.renderer = renderer
-        self.tasks = tasks
+    # default memory budget for decoded source pictures
+    SOURCE_CACHE_SIZE = 512 * 1024 * 1024
+
+    # default maximum number of tasks handed out ahead of the renderer
+    TASK_WINDOW = 64
+
+    # default memory budget for finished frames waiting for the renderer,
+    # limited to a quarter of the available memory
+    REORDER_BUFFER_SIZE = 512 * 1024 * 1024
+
+    # maximum number of consecutive frames of the same pictures that are
+    # handed out as one workload
+    BATCH_SIZE = 8
 
-        self.SetMaxProgress(len(tasks))
+    # number of pictures that are decoded ahead of the frames that need them
+    PREFETCH_COUNT = 2
 
+    # the result of a frame that failed, see BaseRenderer.SkipFrame()
+    FAILED_FRAME = object()
+
+    def __init__(self, name, renderer, tasks, sourceCacheSize=None,
+                 taskCount=None, frameCache=None, sourceTasks=None,
+                 taskWindow=None, reorderBufferSize=None):
+        '''
+        :param tasks: a list of tasks or a generator that creates them on
+                      demand, see RenderEngine.IterTasks()
+        :param taskCount: the number of tasks, must be given for generators
+        :param frameCache: an optional FrameCache for the rendered frames
+        :param sourceTasks: an optional list or generator of the TaskLoadPic
+                            in the order they are needed to decode the
+                            pictures ahead, see
+                            RenderEngine.IterSourceTasks()
+        :param taskWindow: the maximum number of tasks handed out ahead of
+                           the renderer, the workers wait if it is reached
+        :param reorderBufferSize: the memory budget in bytes for finished
+                                  frames waiting for the renderer, the task
+                                  window shrinks to the frames that fit
+        '''
+        VisualJob.__init__(self, name, groupId="render")
+        self.renderer = renderer
+        if taskCount is None:
+            taskCount = len(tasks)
+        self.tasks = iter(tasks)
+        self.taskIdx = 0
+        # tasks already registered in the result cache, at least the next
+        # task is registered before a task is handed out, so results shared
+        # with the next task are not released in the meantime
+        self.pendingTasks = collections.deque()
+
+        self.SetMaxProgress(taskCount)
+
+        if taskWindow is None:
+            taskWindow = RenderJob.TASK_WINDOW
+        self.taskWindow = taskWindow
+
+        if reorderBufferSize is None:
+            reorderBufferSize = RenderJob.REORDER_BUFFER_SIZE
+            available = GetAvailableMemory()
+            if available is not None:
+                reorderBufferSize = min(reorderBufferSize, available // 4)
+        self.reorderBufferSize = reorderBufferSize
+        # bytes of the results not passed to the renderer yet and the
+        # estimated bytes of a result, guarded by resultForRendererEvent
+        self.reorderBytes = 0
+        self.reorderPeak = 0
+        self.frameBytes = None
+        self.frameBytesMeasured = False
+
+        # the results are passed to the renderer in order by the sink thread
         self.resultsForRendererLock = threading.Lock()
         self.resultForRendererIdx = 0
         self.resultsForRendererCache = {}
+        self.resultForRendererEvent = threading.Condition()
+        self.sinkEvent = threading.Condition(self.resultsForRendererLock)
+        self.sinkThread = None
+        self.sinkStop = False
+        self.sinkTime = 0.0
+        self.windowWaitTime = 0.0
 
         self.taskResultCache = {}
+        self.taskResultCacheLock = threading.Lock()
+        if sourceCacheSize is None:
+            sourceCacheSize = RenderJob.SOURCE_CACHE_SIZE
+        self.sourceCache = SourceCache(sourceCacheSize)
         self.finalizeHandler = self.renderer.GetFinalizeHandler()
 
+        # message of an error that spoiled the output, see Done()
+        self.errorMessage = None
+
+        self.frameCache = frameCache
+        self.frameCacheLock = threading.Lock()
+        self.frameCacheHits = 0
+        self.frameCacheMisses = 0
+
+        # the TaskLoadPic taken from sourceTasks so far
+        self.prefetchTasks = []
+        # the remaining TaskLoadPic, None if there are no more
+        self.prefetchSource = None if sourceTasks is None else iter(sourceTasks)
+        # index of the first picture not needed by the registered tasks yet
+        self.prefetchCursor = 0
+        # index of the next picture to decode ahead
+        self.prefetchNext = 0
+        # keys of prefetched pictures that are held until they are decoded
+        # and a task registered them, with the events still missing, guarded
+        # by taskResultCacheLock
+        self.prefetchHeld = {}
+
         self.__logger = logging.getLogger("RenderJob")
 
     def GetOutputPath(self):
         return self.renderer.GetOutputPath()
 
     def Done(self):
+        if self.sinkThread is not None:
+            # all results are pushed, the sink passes the remaining ones
+            with self.sinkEvent:
+                self.sinkStop = True
+                self.sinkEvent.notify()
+            self.sinkThread.join()
+
         if self.IsAborted():
             self.renderer.ProcessAbort()
-        self.renderer.Finalize()
+        try:
+            self.renderer.Finalize()
+        except RenderException as exc:
+            self.errorMessage = exc.GetMessage()
+            self.__logger.error("%s: %s", self.GetName(), self.errorMessage)
 
         self.__logger.debug("task cache: %s; result cache: %s",
                            len(self.taskResultCache),
                            len(self.resultsForRendererCache))
+        self.__logger.debug("source cache: %s hits; %s misses; %s evictions",
+                            *self.GetSourceCacheStatistics())
+        self.__logger.debug("reorder buffer: %s bytes peak; %s bytes budget",
+                            self.reorderPeak, self.reorderBufferSize)
+        self.__logger.info("sink: %.1fs passing frames; "
+                           "workers: %.1fs waiting for the sink",
+                           *self.GetSinkStatistics())
+        if self.frameCache is not None:
+            hits, misses = self.GetFrameCacheStatistics()
+            self.__logger.info("frame cache: %s hits; %s misses; %.1f%% hit rate",
+                               hits, misses,
+                               100.0 * hits / max(hits + misses, 1))
+
+    def GetSourceCacheStatistics(self):
+        '''
+        Returns the number of hits, misses and evictions of the cache for
+        decoded source pictures.
+        '''
+        return self.sourceCache.GetStatistics()
 
-    def Begin(self):
-        # prepare task queue
-        self.__logger.debug("%s: prepare task queue", self.GetName())
-        for idx, task in enumerate(self.tasks):
-            for subTask in task.IterSubTasks():
-                self._RegisterTaskResult(subTask, True)
+    def GetFrameCacheStatistics(self):
+        '''
+        Returns the number of frames of this job that were found in the
+        frame cache and the number of frames that were rendered.
+        '''
+        with self.frameCacheLock:
+            return self.frameCacheHits, self.frameCacheMisses
 
-            self._RegisterTaskResult(task, False)
+    def GetErrorMessage(self):
+        '''
+        Returns the message of the error that spoiled the output or None.
+        '''
+        return self.errorMessage
 
-            prt = RendererResultTask(idx, task)
-            self.AddWorkLoad(prt)
+    def GetSinkStatistics(self):
+        '''
+        Returns the seconds the sink thread spent in renderer.ToSink() and
+        the seconds the workers waited because the task window was full.
+        '''
+        return self.sinkTime, self.windowWaitTime
 
+    def CountFrameCacheAccess(self, hit):
+        with self.frameCacheLock:
+            if hit:
+                self.frameCacheHits += 1
+            else:
+                self.frameCacheMisses += 1
+
+    def Begin(self):
         # prepare the renderer, creates the sink pipe
         self.renderer.Prepare()
 
+        self.sinkThread = threading.Thread(target=self.__RunSink,
+                                           name="%s-sink" % self.GetName())
+        self.sinkThread.daemon = True
+        self.sinkThread.start()
+
+    def __RunSink(self):
+        '''
+        Passes the results to the renderer in the order of the tasks. A slow
+        renderer blocks only this thread, the workers continue until the
+        task window is full.
+        '''
+        while 1:
+            with self.sinkEvent:
+                while self.resultForRendererIdx not in self.resultsForRendererCache \
+                        and not self.sinkStop:
+                    self.sinkEvent.wait()
+
+                results = []
+                idx = self.resultForRendererIdx
+                while idx in self.resultsForRendererCache:
+                    results.append(self.resultsForRendererCache.pop(idx))
+                    idx += 1
+            if not results:
+                # stopped, results of an aborted job may be missing
+                break
+
+            size = 0
+            for imgData in results:
+                size += self.__GetResultSize(imgData)
+                if not self.IsAborted():
+                    start = time.time()
+                    try:
+                        if imgData is self.FAILED_FRAME:
+                            self.renderer.SkipFrame()
+                        elif imgData:
+                            self.renderer.ToSink(imgData)
+                    except Exception as exc:
+                        self.__logger.error("%s: sink failed", self.GetName(),
+                                            exc_info=1)
+                        self.Abort("Error: %s" % exc)
+                    self.sinkTime += time.time() - start
+
+            count = len(results)
+            # the frames are freed before the workers continue
+            del results, imgData
+            with self.resultForRendererEvent:
+                self.resultForRendererIdx += count
+                self.reorderBytes -= size
+                self.resultForRendererEvent.notify_all()
+            self.StepProgress(progress=count)
+
+    def __PullTask(self):
+        '''
+        Takes the next task from the task generator and registers it and its
+        sub tasks in the result cache.
+        '''
+        task = next(self.tasks, None)
+        if task is None:
+            return
+        with self.taskResultCacheLock:
+            for subTask in task.IterSubTasks():
+                self._RegisterTaskResult(subTask, True)
+
+            self._RegisterTaskResult(task, False)
+        self.pendingTasks.append(task)
+
+        if self.frameBytes is None and isinstance(task, TaskImaging):
+            # until the first frame is finished assume a raw RGB frame
+            width, height = task.resolution
+            with self.resultForRendererEvent:
+                self.frameBytes = width * height * 3
+
+        if self.prefetchTasks or self.prefetchSource is not None:
+            sources = self.__GetSources(task)
+            while self.__HasPrefetchTask(self.prefetchCursor) and \
+                    self.prefetchTasks[self.prefetchCursor].GetKey() in sources:
+                self.prefetchCursor += 1
+            for key in sources:
+                # the task holds the decoded picture now
+                self.__ReleasePrefetch("{0}{1}".format(key, True),
+                                       "registered")
+
+    def __HasPrefetchTask(self, idx):
+        '''
+        Takes the TaskLoadPic from sourceTasks up to the given index, so the
+        order is produced while the tasks are handed out.
+        '''
+        while self.prefetchSource is not None and \
+                idx >= len(self.prefetchTasks):
+            task = next(self.prefetchSource, None)
+            if task is None:
+                self.prefetchSource = None
+            else:
+                self.prefetchTasks.append(task)
+        return idx < len(self.prefetchTasks)
+
+    def __GetPrefetchWorkLoad(self):
+        '''
+        Returns a workload that decodes the next picture ahead or None if
+        PREFETCH_COUNT pictures are decoded ahead or the source cache is
+        full.
+        '''
+        self.prefetchNext = max(self.prefetchNext, self.prefetchCursor)
+        if self.prefetchNext >= self.prefetchCursor + self.PREFETCH_COUNT or \
+                not self.__HasPrefetchTask(self.prefetchNext):
+            return None
+        if not self.sourceCache.HasRoom():
+            return None
+
+        task = self.prefetchTasks[self.prefetchNext]
+        self.prefetchNext += 1
+        key = "{0}{1}".format(task.GetKey(), True)
+        with self.taskResultCacheLock:
+            if key in self.taskResultCache:
+                # the same picture is used by registered tasks already
+                return None
+            # the decoded picture is held until the first task registers it
+            self._RegisterTaskResult(task, True)
+            self.prefetchHeld[key] = {"decoded", "registered"}
+        return PrefetchTask(key, task)
+
+    def __ReleasePrefetch(self, key, event):
+        '''
+        Releases the reference held by __GetPrefetchWorkLoad() once the
+        picture is decoded and a task registered it, whichever comes last.
+        Released earlier a task could free the entry before the PrefetchTask
+        runs.
+        :param event: "decoded" or "registered"
+        '''
+        with self.taskResultCacheLock:
+            pending = self.prefetchHeld.get(key)
+            if pending is None:
+                return
+            pending.discard(event)
+            if pending:
+                return
+            del self.prefetchHeld[key]
+        self.__ReleaseTaskResult(key)
+
     def _RegisterTaskResult(self, task, isSubTask):
         if not self.finalizeHandler.UseSmartFinalize() or isSubTask:
             # no finalize for subtasks
@@ -85,103 +374,316 @@ class RenderJob(VisualJob):
             trce = self.taskResultCache[key]
             isNew = False
         else:
-            trce = TaskResultCacheEntry(task, self, finalizeHandler)
+            if isinstance(task, TaskLoadPic):
+                # decoded pictures are held by the memory bounded cache
+                sourceCache = self.sourceCache
+            else:
+                sourceCache = None
+            if self.frameCache is not None and not isSubTask and \
+                    isinstance(task, TaskImaging):
+                frameCache = self.frameCache
+            else:
+                frameCache = None
+            trce = TaskResultCacheEntry(task, self, finalizeHandler,
+                                        key, sourceCache, frameCache)
             self.taskResultCache[key] = trce
             isNew = True
 
+        # the ref count is guarded by taskResultCacheLock, trce.lock is held
+        # while the task runs and would deadlock with ProcessSubTask
         trce.refCount += 1
         return isNew
 
     def GetWorkLoad(self):
-        task = VisualJob.GetWorkLoad(self)
-        self.SetInfo(task.GetInfo())
+        '''
+        overrides Job.GetWorkLoad
+        Hands out the next tasks but stays within the window of tasks ahead
+        of the renderer, see __GetWindow(). Is called by one worker at a
+        time.
+        '''
+        if (self.prefetchTasks or self.prefetchSource is not None) and \
+                not self.IsAborted():
+            # also uses workers that would wait for the renderer
+            workLoad = self.__GetPrefetchWorkLoad()
+            if workLoad is not None:
+                return workLoad
+
+        with self.resultForRendererEvent:
+            start = time.time()
+            while not self.IsAborted() and \
+                    (self.taskIdx - self.resultForRendererIdx >= self.__GetWindow()
+                     or self.reorderBytes >= self.reorderBufferSize):
+                # all tasks before are in progress, so the renderer catches
+                # up without a deadlock
+                self.resultForRendererEvent.wait(0.25)
+            self.windowWaitTime += time.time() - start
+            free = self.__GetWindow() - (self.taskIdx - self.resultForRendererIdx)
 
-        self.__logger.debug("%s: %s: %s - start",
-                            threading.current_thread().getName(),
-                            self.GetName(), task.GetKey())
+        if self.IsAborted():
+            raise queue.Empty()
+
+        if not self.pendingTasks:
+            self.__PullTask()
+        if not self.pendingTasks:
+            raise queue.Empty()
+
+        # the batches get smaller if the renderer falls behind, so the
+        # remaining tasks are spread over all workers
+        batchSize = max(1, min(self.BATCH_SIZE, free // 4))
+        tasks = [self.pendingTasks.popleft()]
+        sources = self.__GetSources(tasks[0])
+        while len(tasks) < batchSize and sources:
+            if not self.pendingTasks:
+                self.__PullTask()
+            if not self.pendingTasks or \
+                    self.__GetSources(self.pendingTasks[0]) != sources:
+                break
+            tasks.append(self.pendingTasks.popleft())
+        # the next task must be registered before the tasks are processed
+        if not self.pendingTasks:
+            self.__PullTask()
+
+        task = RendererResultTask(self.taskIdx, tasks)
+        self.taskIdx += len(tasks)
+
+        info = task.GetInfo()
+        if info != self.GetInfo():
+            self.SetInfo(info)
+
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("%s: %s: %s - start",
+                                threading.current_thread().getName(),
+                                self.GetName(), task.GetKey())
 
         return task
 
+    def __GetWindow(self):
+        '''
+        Returns the number of tasks that may be handed out ahead of the
+        renderer. While a slow frame is rendered the following frames wait
+        in the reorder buffer, so the window is limited to the frames that
+        fit into its budget.
+        '''
+        if not self.frameBytes:
+            return self.taskWindow
+        return max(1, min(self.taskWindow,
+                          self.reorderBufferSize // self.frameBytes))
+
+    def __GetResultSize(self, result):
+        '''
+        Returns the approximate bytes of a finalized frame.
+        '''
+        if isinstance(result, (bytes, bytearray)):
+            return len(result)
+        elif isinstance(result, Image.Image):
+            return PILBackend.GetImageByteSize(result)
+        elif hasattr(result, "get_stride"):
+            # a cairo surface
+            return result.get_stride() * result.get_height()
+        return 0
+
+    def __GetSources(self, task):
+        '''
+        Returns the keys of the pictures a task is rendered from.
+        '''
+        return tuple(subTask.GetKey() for subTask in task.IterSubTasks()
+                     if isinstance(subTask, TaskLoadPic))
+
     def PushResult(self, resultObject):
         '''
         overrides IJobContext.PushResult
         '''
         task = resultObject.GetSource()
-        self.__logger.debug("%s: %s: %s - done",
-                            threading.current_thread().getName(),
-                            self.GetName(), task.GetKey())
+        if self.__logger.isEnabledFor(logging.DEBUG):
+            self.__logger.debug("%s: %s: %s - done",
+                                threading.current_thread().getName(),
+                                self.GetName(), task.GetKey())
+        if isinstance(task, PrefetchTask):
+            # a failed picture is decoded again by the frames that need it
+            return
 
+        results = {}
         try:
-            result = resultObject.GetResult()
-            if not self.finalizeHandler.UseSmartFinalize() and result:
-                result = self.finalizeHandler.ProcessFinalize(result)
-            self.resultsForRendererCache[task.idx] = result
+            for idx, result in enumerate(resultObject.GetResult(), task.idx):
+                if not self.finalizeHandler.UseSmartFinalize() and result and \
+                        result is not self.FAILED_FRAME:
+                    result = self.finalizeHandler.ProcessFinalize(result)
+                results[idx] = result
         except JobAbortedException:
-            pass
-        with self.resultsForRendererLock:
-            while self.resultForRendererIdx in self.resultsForRendererCache:
-                idx = self.resultForRendererIdx
-
-                self.__logger.debug("%s: %s: resultToFetch: %s",
-                                    threading.current_thread().getName(),
-                                    self.GetName(), idx)
+            return
+        except Exception:
+            # skip the frames, otherwise the renderer waits for them forever
+            self.__logger.error("%s: %s: %s - failed",
+                                threading.current_thread().getName(),
+                                self.GetName(), task.GetKey(), exc_info=1)
+            for idx in range(task.idx, task.idx + task.GetCount()):
+                results.setdefault(idx, self.FAILED_FRAME)
+
+        # failed frames are not measured
+        sizes = [self.__GetResultSize(result) for result in results.values()
+                 if result is not self.FAILED_FRAME]
+        with self.resultForRendererEvent:
+            self.reorderBytes += sum(sizes)
+            self.reorderPeak = max(self.reorderPeak, self.reorderBytes)
+            for size in sizes:
+                if self.frameBytesMeasured:
+                    self.frameBytes = (self.frameBytes * 7 + size) // 8
+                else:
+                    self.frameBytes = size
+                    self.frameBytesMeasured = True
+
+        with self.sinkEvent:
+            self.resultsForRendererCache.update(results)
+            self.sinkEvent.notify()
+
+    def Prefetch(self, key):
+        '''
+        Decodes a picture registered by __GetPrefetchWorkLoad() into the
+        source cache.
+        '''
+        try:
+            self.__GetTaskResult(key)
+        finally:
+            self.__ReleasePrefetch(key, "decoded")
 
-                imgData = self.resultsForRendererCache[idx]
-                if imgData:
-                    self.renderer.ToSink(imgData)
-                del self.resultsForRendererCache[idx]
-                self.resultForRendererIdx += 1
+    def __GetTaskResult(self, key):
+        '''
+        Returns the result of a registered task without releasing it.
+        '''
+        with self.taskResultCacheLock:
+            trce = self.taskResultCache[key]
+        return trce.GetResult()[0]
 
-                self.StepProgress()
+    def RunTask(self, task, finalizeHandler=None):
+        '''
+        Runs a task of the result cache. If the worker owns a WorkerProcess
+        imaging tasks are run in that process, so their sub tasks are not
+        processed and the result is finalized with finalizeHandler.
+        :returns: the result and True if the sub tasks were processed
+        '''
+        process = GetCurrentProcess()
+        if process is None:
+            return task.Run(self), True
+        if isinstance(task, TaskLoadPic):
+            return RenderProcess.Decode(process, task), True
+        if not isinstance(task, TaskImaging):
+            return task.Run(self), True
+
+        sources = {}
+        for subTask in task.IterSubTasks():
+            if isinstance(subTask, TaskLoadPic):
+                sources[subTask.GetKey()] = self.__GetTaskResult(
+                    "{0}{1}".format(subTask.GetKey(), True))
+        return RenderProcess.Render(process, task, sources,
+                                    finalizeHandler), False
 
     def ProcessSubTask(self, task, isSubTask=True):
         key = "{0}{1}".format(task.GetKey(), isSubTask)
-        trce = self.taskResultCache[key]
-        result = trce.GetResult()
-        if trce.refCount == 0:
+        with self.taskResultCacheLock:
+            trce = self.taskResultCache[key]
+        result, processed = trce.GetResult()
+        if not processed:
+            # the result is shared with an identical task or came from the
+            # frame cache, the sub tasks registered with this task are unused
+            for subTask in task.IterSubTasks():
+                self.__ReleaseTaskResult("{0}{1}".format(subTask.GetKey(),
+                                                         True))
+        self.__ReleaseTaskResult(key)
+        return result
+
+    def __ReleaseTaskResult(self, key):
+        with self.taskResultCacheLock:
+            trce = self.taskResultCache[key]
+            trce.refCount -= 1
+            refCount = trce.refCount
+            released = refCount == 0
+            if released:
+                del self.taskResultCache[key]
+        if released and trce.sourceCache is not None:
+            trce.sourceCache.Remove(key)
+
+        if not self.__logger.isEnabledFor(logging.DEBUG):
+            return
+        if released:
             self.__logger.debug("%s: %s: clear cached result %s",
                                 threading.current_thread().getName(),
                                 self.GetName(), key)
-            del self.taskResultCache[key]
         else:
             self.__logger.debug("%s: %s: result ref count %s %s",
                                 threading.current_thread().getName(),
-                                self.GetName(), trce.refCount, key)
-
-        return result
+                                self.GetName(), refCount, key)
 
 
 class RendererResultTask(WorkLoad):
     '''
     its more like a dummy task just to assure the correct reference counting
-    of task results especially concerning sub tasks.
+    of task results especially concerning sub tasks. Renders a batch of
+    consecutive frames, the result is a list with a result per frame.
     '''
 
-    def __init__(self, idx, task):
+    def __init__(self, idx, tasks):
         WorkLoad.__init__(self)
         self.idx = idx
-        self.task = task
+        self.tasks = tasks
 
     def GetKey(self):
         return self.idx
 
+    def GetCount(self):
+        return len(self.tasks)
+
     def Run(self, jobContext):
-        # self.task is not really a sub task, but is processed as a sub task to
-        # use the result cache
-        return jobContext.ProcessSubTask(self.task, False)
+        results = []
+        for task in self.tasks:
+            if jobContext.IsAborted():
+                raise JobAbortedException()
+            try:
+                # task is not really a sub task, but is processed as a sub
+                # task to use the result cache
+                results.append(jobContext.ProcessSubTask(task, False))
+            except JobAbortedException:
+                raise
+            except Exception:
+                # skip the frame, otherwise the renderer waits for it forever
+                logging.getLogger("RenderJob").error(
+                    "%s: %s - failed", jobContext.GetName(), task.GetKey(),
+                    exc_info=1)
+                results.append(RenderJob.FAILED_FRAME)
+        return results
 
     def GetInfo(self):
-        return self.task.GetInfo()
+        return self.tasks[0].GetInfo()
+
+
+class PrefetchTask(WorkLoad):
+    '''
+    Decodes a picture before the frames that need it are processed.
+    '''
+
+    def __init__(self, key, task):
+        WorkLoad.__init__(self)
+        self.key = key
+        self.task = task
+
+    def GetKey(self):
+        return self.key
+
+    def Run(self, jobContext):
+        jobContext.Prefetch(self.key)
 
 
 class TaskResultCacheEntry:
 
     NO_RESULT = object()
 
-    def __init__(self, task, renderJob, finalizeHandler):
+    def __init__(self, task, renderJob, finalizeHandler,
+                 key=None, sourceCache=None, frameCache=None):
         self.task = task
         self.renderJob = renderJob
         self.finalizeHandler = finalizeHandler
+        self.key = key
+        self.sourceCache = sourceCache
+        self.frameCache = frameCache
         self.refCount = 0
         self.result = TaskResultCacheEntry.NO_RESULT
         self.lock = threading.Lock()
@@ -191,10 +693,105 @@ class TaskResultCacheEntry:
         self.result = result
 
     def GetResult(self):
+        '''
+        Returns the result and True if the task was run by this call.
+        '''
+        if self.sourceCache is not None:
+            return self.__GetSourceCacheResult(), True
+
         with self.lock:
+            processed = False
             if self.result is TaskResultCacheEntry.NO_RESULT:
-                self.result = self.task.Run(self.renderJob)
-                if self.finalizeHandler and self.result:
-                    self.result = self.finalizeHandler.ProcessFinalize(self.result)
-            self.refCount -= 1
-            return self.result
+                result = None
+                frameKey = None
+                if self.frameCache is not None:
+                    frameKey = self.frameCache.GetKey(self.task)
+                if frameKey is not None:
+                    result = self.frameCache.Get(frameKey)
+                    self.renderJob.CountFrameCacheAccess(result is not None)
+                finalized = False
+                if result is None:
+                    if frameKey is None and self.finalizeHandler and \
+                            self.finalizeHandler.UseRemoteFinalize():
+                        finalizeHandler = self.finalizeHandler
+                    else:
+                        # the frame cache stores the image
+                        finalizeHandler = None
+                    result, processed = self.renderJob.RunTask(
+                        self.task, finalizeHandler)
+                    finalized = not processed and finalizeHandler is not None
+                    if frameKey is not None and result:
+                        self.frameCache.Put(frameKey, result)
+                if self.finalizeHandler and result and not finalized:
+                    result = self.finalizeHandler.ProcessFinalize(result)
+                self.result = result
+            return self.result, processed
+
+    def __GetSourceCacheResult(self):
+        with self.lock:
+            result = self.sourceCache.Get(self.key)
+            if result is None:
+                # not decoded yet or evicted in the meantime
+                result = self.renderJob.RunTask(self.task)[0]
+                self.sourceCache.Put(self.key, result, result.GetByteSize())
+            return result
+
+
+class SourceCache:
+    '''
+    A memory bounded cache for decoded source pictures. If the size of all
+    cached pictures exceeds the budget the least recently used pictures are
+    evicted, they are decoded again on the next access.
+    '''
+
+    def __init__(self, maxBytes):
+        self.__maxBytes = maxBytes
+        self.__entries = collections.OrderedDict()
+        self.__bytes = 0
+        self.__maxEntrySize = 0
+        self.__lock = threading.Lock()
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def Get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry[0]
+
+    def Put(self, key, result, size):
+        with self.__lock:
+            if key in self.__entries:
+                self.__bytes -= self.__entries.pop(key)[1]
+            self.__entries[key] = (result, size)
+            self.__bytes += size
+            self.__maxEntrySize = max(self.__maxEntrySize, size)
+
+            # keep at least the new entry, even if it exceeds the budget
+            while self.__bytes > self.__maxBytes and len(self.__entries) > 1:
+                __, entry = self.__entries.popitem(last=False)
+                self.__bytes -= entry[1]
+                self.__evictions += 1
+
+    def HasRoom(self):
+        '''
+        Returns True if the largest picture so far fits into the budget
+        without evicting others.
+        '''
+        with self.__lock:
+            return self.__bytes + self.__maxEntrySize <= self.__maxBytes
+
+    def Remove(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.__bytes -= self.__entries.pop(key)[1]
+
+    def GetStatistics(self):
+        with self.__lock:
+            return self.__hits, self.__misses, self.__evictions
@@ -0,0 +1,295 @@
+# encoding: UTF-8
+#
+# PhotoFilmStrip - Creates movies out of your pictures.
+#
+# Copyright (C) 2026 Jens Goepfert
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+'''
+Runs imaging tasks in the WorkerProcess of a render worker. Decoded source
+pictures are written once to shared memory and mapped by every process that
+crops frames from them. The frames are passed back in a shared buffer per
+process. Tasks are pickled with their pictures and sources replaced by keys,
+a picture is only sent once to each process.
+'''
+
+import collections
+import io
+import pickle
+import weakref
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from photofilmstrip.core import PILBackend
+from photofilmstrip.core.Picture import Picture
+from photofilmstrip.core.tasks import TaskLoadPic
+
+
+class SharedPicture:
+    '''
+    Handle of a decoded source picture in shared memory. The memory is
+    released when the last handle is gone, processes that still map it
+    keep their mapping.
+    '''
+
+    def __init__(self, name, mode, size):
+        '''
+        :param name: the name of the shared memory, None for pictures that
+                     are decoded on demand by every process, see TiledImage
+        :param mode: the raw mode of the pixels
+        '''
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.block = None
+        if name is not None:
+            self.block = _SharedBlock(shared_memory.SharedMemory(name=name))
+
+    def GetByteSize(self):
+        if self.block is None:
+            return 0
+        return self.block.shm.size
+
+    def GetDescriptor(self):
+        return self.name, self.mode, self.size
+
+
+class _SharedBlock:
+    '''
+    Owns a block of shared memory and unlinks it with the last reference.
+    '''
+
+    def __init__(self, shm):
+        self.shm = shm
+        weakref.finalize(self, _Release, shm)
+
+
+def _Release(shm):
+    try:
+        shm.close()
+    except BufferError:
+        # still mapped by an image, the mapping is freed with the image
+        pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class _TaskPickler(pickle.Pickler):
+    '''
+    Replaces pictures and TaskLoadPic by keys, pictures the process does not
+    know yet are collected in newPictures.
+    '''
+
+    def __init__(self, fd, knownPictures):
+        pickle.Pickler.__init__(self, fd, pickle.HIGHEST_PROTOCOL)
+        self.knownPictures = knownPictures
+        self.newPictures = {}
+
+    def persistent_id(self, obj):  # pylint: disable=method-hidden
+        if isinstance(obj, Picture):
+            key = obj.GetKey()
+            if key not in self.knownPictures and key not in self.newPictures:
+                # a copy has no observers
+                self.newPictures[key] = obj.Copy()
+            return ("picture", key)
+        if isinstance(obj, TaskLoadPic):
+            return ("source", self.persistent_id(obj.picture)[1],
+                    obj.reduction)
+        return None
+
+
+class _TaskUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        if pid[0] == "picture":
+            return _pictures[pid[1]]
+        elif pid[0] == "source":
+            return TaskLoadPic(_pictures[pid[1]], pid[2])
+        raise pickle.UnpicklingError("unknown id %s" % (pid,))
+
+
+def __Dump(process, task):
+    knownPictures = process.data.setdefault("pictures", set())
+    fd = io.BytesIO()
+    pickler = _TaskPickler(fd, knownPictures)
+    pickler.dump(task)
+    knownPictures.update(pickler.newPictures)
+    return fd.getvalue(), pickler.newPictures
+
+
+def __GetFrameBuffer(process, size):
+    block = process.data.get("frameBuffer")
+    if block is None or block.shm.size < size:
+        block = _SharedBlock(shared_memory.SharedMemory(create=True,
+                                                        size=size))
+        process.data["frameBuffer"] = block
+    return block.shm
+
+
+def Decode(process, taskLoadPic):
+    '''
+    Decodes a source picture in the given process.
+    :rtype: SharedPicture
+    '''
+    data, newPictures = __Dump(process, taskLoadPic)
+    return SharedPicture(*process.Call(_Decode, data, newPictures))
+
+
+def Render(process, task, sources, finalizeHandler=None):
+    '''
+    Runs an imaging task in the given process.
+    :param sources: dict of the TaskLoadPic keys of the task to SharedPicture
+    :param finalizeHandler: an optional FinalizeHandler that is applied in
+                            the process, see UseRemoteFinalize()
+    :returns: a PIL image or the finalized frame
+    '''
+    data, newPictures = __Dump(process, task)
+    descriptors = dict((key, source.GetDescriptor())
+                       for key, source in sources.items())
+    # large enough for all frame formats, JPEG headers of tiny frames included
+    width, height = task.resolution
+    shm = __GetFrameBuffer(process, width * height * 4 + 64 * 1024)
+
+    mode, size, payload = process.Call(_Render, data, newPictures,
+                                       descriptors, shm.name,
+                                       finalizeHandler)
+    if isinstance(payload, int):
+        payload = bytes(shm.buf[:payload])
+    if mode is None:
+        return payload
+    return Image.frombytes(mode, size, payload)
+
+
+# the following is only used in the worker processes
+
+# number of sources that are mapped by a process
+SOURCE_COUNT = 4
+
+_pictures = {}
+_sources = collections.OrderedDict()
+_frameBuffer = None
+
+
+class _SharedPyramid(PILBackend.ImagePyramid):
+    '''
+    ImagePyramid of a picture in shared memory, RGB is shared as RGBX
+    because only that can be mapped by PIL without copying.
+    '''
+
+    def CropAndResize(self, rect, size, draft=False):
+        img = PILBackend.ImagePyramid.CropAndResize(self, rect, size, draft)
+        if img.mode == "RGBX":
+            img = img.convert("RGB")
+        return img
+
+
+class _ProcessContext:
+    '''
+    Job context of the tasks in a worker process.
+    '''
+
+    def __init__(self, descriptors):
+        self.__descriptors = descriptors
+
+    def ProcessSubTask(self, task):
+        if isinstance(task, TaskLoadPic):
+            return _GetSource(task, self.__descriptors[task.GetKey()])
+        return task.Run(self)
+
+
+def _AddSource(key, shm, source):
+    _sources[key] = (shm, source)
+    while len(_sources) > SOURCE_COUNT:
+        __, (shm, source) = _sources.popitem(last=False)
+        del source
+        if shm is not None:
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+
+def _GetSource(taskLoadPic, descriptor):
+    name, mode, size = descriptor
+    key = taskLoadPic.GetKey() if name is None else name
+    entry = _sources.get(key)
+    if entry is not None:
+        _sources.move_to_end(key)
+        return entry[1]
+
+    if name is None:
+        shm = None
+        source = PILBackend.GetSourceImage(taskLoadPic.picture,
+                                           taskLoadPic.reduction)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+        source = _SharedPyramid(Image.frombuffer(mode, size, shm.buf,
+                                                 "raw", mode, 0, 1))
+    _AddSource(key, shm, source)
+    return source
+
+
+def _Decode(data, newPictures):
+    _pictures.update(newPictures)
+    taskLoadPic = _TaskUnpickler(io.BytesIO(data)).load()
+    source = PILBackend.GetSourceImage(taskLoadPic.picture,
+                                       taskLoadPic.reduction)
+    if not isinstance(source, PILBackend.ImagePyramid):
+        # tiles are decoded on demand in every process
+        _AddSource(taskLoadPic.GetKey(), None, source)
+        return None, None, None
+
+    img = source.GetImage()
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    mode = "RGBX" if img.mode == "RGB" else img.mode
+    pixels = img.tobytes("raw", mode)
+    shm = shared_memory.SharedMemory(create=True, size=len(pixels))
+    shm.buf[:len(pixels)] = pixels
+    del pixels
+    _AddSource(shm.name, shm,
+               _SharedPyramid(Image.frombuffer(mode, img.size, shm.buf,
+                                               "raw", mode, 0, 1)))
+    return shm.name, mode, img.size
+
+
+def _Render(data, newPictures, descriptors, bufferName, finalizeHandler):
+    global _frameBuffer  # pylint: disable=global-statement
+    _pictures.update(newPictures)
+    task = _TaskUnpickler(io.BytesIO(data)).load()
+    img = task.Run(_ProcessContext(descriptors))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    if finalizeHandler is None:
+        mode = img.mode
+        payload = img.tobytes()
+    else:
+        mode = None
+        payload = finalizeHandler.ProcessFinalize(img)
+
+    if _frameBuffer is None or _frameBuffer.name != bufferName:
+        if _frameBuffer is not None:
+            _frameBuffer.close()
+        _frameBuffer = shared_memory.SharedMemory(name=bufferName)
+    if len(payload) > _frameBuffer.size:
+        return mode, img.size, payload
+    _frameBuffer.buf[:len(payload)] = payload
+    return mode, img.size, len(payload)
@@ -0,0 +1,141 @@
+# encoding: UTF-8
+#
+# PhotoFilmStrip - Creates movies out of your pictures.
+#
+# Copyright (C) 2026 Jens Goepfert
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+#
+
+import hashlib
+import logging
+import os
+
+
+class SegmentCache:
+    '''
+    Cache for the encoded video of the segments of a slideshow, see
+    RenderEngine.GetSegments(). A segment is stored under a hash of
+    everything that affects its pixels, so after an edit only the changed
+    segments are encoded again.
+    '''
+
+    EXTENSION = "seg"
+
+    def __init__(self, cacheDir, context):
+        '''
+        :param cacheDir: the directory for the segment files
+        :param context: a repr-able value with all settings that affect every
+                        segment, e.g. renderer properties and the profile
+        '''
+        self.__cacheDir = cacheDir
+        self.__context = repr(context)
+        if not os.path.exists(cacheDir):
+            os.makedirs(cacheDir)
+
+    def __GetPictureKey(self, picture, withComment):
+        filename = picture.GetFilename()
+        try:
+            stat = os.stat(filename)
+            fileKey = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            fileKey = None
+        return (filename, fileKey,
+                picture.GetRotation(), picture.GetEffect(),
+                picture.GetComment() if withComment else None)
+
+    def GetKey(self, segment, withComment=False):
+        '''
+        Returns the key of a FrameSegment.
+        :param withComment: True if the comments are rendered into the video
+        '''
+        key = [self.__context, segment.frameCount,
+               self.__GetPictureKey(segment.picture, withComment),
+               segment.path.GetKey(), segment.firstStep]
+        if segment.pictureFrom is not None:
+            key += [segment.transKind,
+                    self.__GetPictureKey(segment.pictureFrom, withComment),
+                    segment.pathFrom.GetKey(), segment.firstStepFrom]
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def GetPath(self, key):
+        return os.path.join(self.__cacheDir,
+                            "{0}.{1}".format(key, self.EXTENSION))
+
+    def GetTempPath(self, key):
+        '''
+        Returns the path a segment is encoded to before it is stored.
+        '''
+        return self.GetPath(key) + ".tmp"
+
+    def Contains(self, key):
+        return os.path.isfile(self.GetPath(key))
+
+    def Store(self, key):
+        '''
+        Moves the completely encoded file from GetTempPath() into the cache.
+        '''
+        os.replace(self.GetTempPath(key), self.GetPath(key))
+
+    def Discard(self, key):
+        '''
+        Removes an incomplete file from GetTempPath().
+        '''
+        if os.path.exists(self.GetTempPath(key)):
+            os.remove(self.GetTempPath(key))
+
+    def Remove(self, key):
+        '''
+        Removes a stored segment, e.g. one that must not be reused.
+        '''
+        if self.Contains(key):
+            os.remove(self.GetPath(key))
+
+    def Concat(self, keys, outFile, endCode=None):
+        '''
+        Writes the stored segments one after another into outFile. The
+        segments are elementary streams that start with a key frame, so they
+        can be joined without encoding them again.
+        :param endCode: the bytes that end an elementary stream, they are
+                        removed from all segments but the last
+        '''
+        with open(outFile, "wb") as fdOut:
+            for idx, key in enumerate(keys):
+                with open(self.GetPath(key), "rb") as fdIn:
+                    size = os.fstat(fdIn.fileno()).st_size
+                    if endCode and idx < len(keys) - 1:
+                        fdIn.seek(max(0, size - len(endCode)))
+                        if fdIn.read() == endCode:
+                            size -= len(endCode)
+                        fdIn.seek(0)
+                    while size > 0:
+                        data = fdIn.read(min(size, 1024 * 1024))
+                        if not data:
+                            break
+                        fdOut.write(data)
+                        size -= len(data)
+
+    def Prune(self, keys):
+        '''
+        Removes all segments that are not in keys, e.g. of older versions
+        of the project.
+        '''
+        keep = set(self.GetPath(key) for key in keys)
+        for filename in os.listdir(self.__cacheDir):
+            path = os.path.join(self.__cacheDir, filename)
+            if path not in keep and \
+                    filename.endswith("." + self.EXTENSION):
+                logging.debug("removing unused segment %s", path)
+                os.remove(path)
@@ -49,6 +49,10 @@ class CairoRenderer(BaseRenderer):
     def GetName():
         return _(u"Preview")
 
+    @classmethod
+    def IsInteractive(cls):
+        return True
+
     @staticmethod
     def CheckDependencies(msgList):
         BaseRenderer.CheckDependencies(msgList)
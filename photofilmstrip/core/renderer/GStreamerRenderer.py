@@ -30,7 +30,8 @@ from gi.repository import GObject
 
 from photofilmstrip.core.Aspect import Aspect
 from photofilmstrip.core.OutputProfile import OutputProfile
-from photofilmstrip.core.BaseRenderer import BaseRenderer
+from photofilmstrip.core.BaseRenderer import BaseRenderer, \
+    RawFrameFinalizeHandler
 from photofilmstrip.core.Subtitle import SrtParser
 from photofilmstrip.core.exceptions import RendererException
 
@@ -56,6 +57,23 @@ class _GStreamerRenderer(BaseRenderer):
         self.concat = None
         self.ptsOffset = 0
         self.ptsLast = -1
+        self.audioStart = 0
+        self.frameOffset = 0
+
+        # segment mode, see SetSegments()
+        self.__segmentCache = None
+        self.__segments = None
+        self.__idxSegment = None
+        self.__segmentFile = None
+        self.__segmentFrames = 0
+        # True if a frame of the current segment failed
+        self.__segmentSkipped = False
+        # keys of the segments with repeated frames, they are joined but
+        # removed from the cache afterwards
+        self.__segmentsRepeated = []
+        # repeated for failed frames, see SkipFrame()
+        self.__lastFrame = None
+        self.__aborted = False
 
     @staticmethod
     def CheckDependencies(msgList):
@@ -69,22 +87,160 @@ class _GStreamerRenderer(BaseRenderer):
 
     @staticmethod
     def GetProperties():
-        return ["Bitrate", "RenderSubtitle"]
+        return ["Bitrate", "RenderSubtitle", "FrameFormat"]
 
     @staticmethod
     def GetDefaultProperty(prop):
         if prop == "RenderSubtitle":
             return "false"
+        if prop == "FrameFormat":
+            return "I420"
         return BaseRenderer.GetDefaultProperty(prop)
 
+    def GetFinalizeHandler(self):
+        '''
+        Raw frames are converted to the video format in the workers, JPEG
+        frames have to be decoded again in the pipeline.
+        :rtype: FinalizeHandler
+        '''
+        frameFormat = self._GetFrameFormat()
+        if frameFormat == "JPEG":
+            return BaseRenderer.GetFinalizeHandler(self)
+        return RawFrameFinalizeHandler(frameFormat)
+
+    @classmethod
+    def SupportsSegments(cls):
+        return cls._GetSegmentFormat() is not None
+
+    @staticmethod
+    def _GetSegmentFormat():
+        '''
+        Returns the caps of the elementary video stream and the name of its
+        parser if segments of it can be joined byte by byte, otherwise None.
+        '''
+        return None
+
+    @staticmethod
+    def _GetSegmentEndCode():
+        '''
+        Returns the bytes an encoder writes at the end of the elementary
+        stream, e.g. the sequence end code of MPEG video. They are removed
+        between the joined segments.
+        '''
+        return None
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        '''
+        Configures the video encoder of a segment. Segments are encoded
+        without B-frames, so the frames are stored in presentation order and
+        the parser of the joined segments timestamps them by the framerate.
+        '''
+        raise NotImplementedError()
+
+    def SetSegments(self, segmentCache, segments):
+        '''
+        Enables the segment mode. Every segment that is missing in the cache
+        is encoded into its own file, Finalize() joins all segments and muxes
+        them with the audio.
+        :param segmentCache: a SegmentCache instance
+        :param segments: a list of (key, firstFrame, frameCount) of all
+                         segments, ToSink() gets the frames of the missing
+                         segments only
+        '''
+        self.__segmentCache = segmentCache
+        self.__segments = segments
+
+    def __GetSegmentsFrameCount(self):
+        return sum(frameCount for __, __, frameCount in self.__segments)
+
+    def __NextSegment(self):
+        '''
+        Prepares the pipeline for the next segment that is missing in the
+        cache.
+        '''
+        self.__segmentFile = None
+        self.__segmentFrames = 0
+        self.__segmentSkipped = False
+        self.__idxSegment += 1
+        while self.__idxSegment < len(self.__segments):
+            key = self.__segments[self.__idxSegment][0]
+            if not self.__segmentCache.Contains(key):
+                self.__segmentFile = self.__segmentCache.GetTempPath(key)
+                self.__Prepare()
+                return
+            self.__idxSegment += 1
+
+    def __FinishSegment(self, complete=True):
+        self.finished = True
+        self.__CleanUp(False)
+        key = self.__segments[self.__idxSegment][0]
+        if complete and not self.__aborted:
+            self.__segmentCache.Store(key)
+            if self.__segmentSkipped:
+                # with repeated frames, must not be reused
+                self.__segmentsRepeated.append(key)
+        else:
+            self.__segmentCache.Discard(key)
+        self.__segmentFile = None
+
+    def __AssembleSegments(self):
+        keys = [key for key, __, __ in self.__segments]
+        try:
+            missing = [key for key in keys
+                       if not self.__segmentCache.Contains(key)]
+            if missing:
+                # the job ended before all frames of the segments arrived
+                raise RendererException(
+                    _(u"%d of %d video segments are incomplete!")
+                    % (len(missing), len(keys)))
+
+            concatFile = os.path.join(self.GetOutputPath(),
+                                      "output.%s.tmp" % self._GetExtension())
+            self.__segmentCache.Concat(keys, concatFile,
+                                       self._GetSegmentEndCode())
+            try:
+                self.__Prepare(concatFile)
+                # the end-of-stream comes from the filesrc
+                self.finished = True
+                self.__CleanUp()
+            finally:
+                os.remove(concatFile)
+            self.__segmentCache.Prune(keys)
+        finally:
+            for key in self.__segmentsRepeated:
+                self.__segmentCache.Remove(key)
+
     def ToSink(self, data):
+        self.__lastFrame = data
         self.resQueue.put(data)
+        self.__CountSegmentFrame()
 
-    def __CleanUp(self):
+    def SkipFrame(self):
+        '''
+        overrides BaseRenderer.SkipFrame
+        Repeats the last frame, so the following frames keep their time and
+        the frames are counted into the right segment.
+        '''
+        self._Log(logging.WARNING, "frame failed, repeating the last frame")
+        if self.__lastFrame is not None:
+            self.resQueue.put(self.__lastFrame)
+        if self.__segmentFile:
+            self.__segmentSkipped = True
+        self.__CountSegmentFrame()
+
+    def __CountSegmentFrame(self):
+        if self.__segmentFile:
+            self.__segmentFrames += 1
+            if self.__segmentFrames == self.__segments[self.__idxSegment][2]:
+                self.__FinishSegment()
+                self.__NextSegment()
+
+    def __CleanUp(self, final=True):
         '''
         Waits until the ready event is set and finished the GTK-Mainloop.
         The ready event is set within _GstOnMessage if the end-of-stream event
         was handled.
+        :param final: False if another pipeline follows for the next segment
         '''
         if self.ready is None:
             return
@@ -107,8 +263,10 @@ class _GStreamerRenderer(BaseRenderer):
         self.concat = None
         self.ptsOffset = 0
         self.ptsLast = -1
+        self.audioStart = 0
+        self.frameOffset = 0
 
-        if self.GetTypedProperty("RenderSubtitle", bool):
+        if final and self.GetTypedProperty("RenderSubtitle", bool):
             # delete subtitle file, if subtitle is rendered in video
             srtPath = os.path.join(self.GetOutputPath(), "output.srt")
             if os.path.exists(srtPath):
@@ -122,12 +280,27 @@ class _GStreamerRenderer(BaseRenderer):
         if self.active:
             self.active = False
 
+        self.__aborted = True
+        if self.__segmentFile:
+            self.__FinishSegment(False)
         self.__CleanUp()
 
     def Prepare(self):
         '''
         Build the gstreamer pipeline and all necessary objects and bindings.
         '''
+        if self.__segments is not None:
+            # the pipeline of the first missing segment
+            self.__idxSegment = -1
+            self.__NextSegment()
+        else:
+            self.__Prepare()
+
+    def __Prepare(self, concatFile=None):
+        '''
+        :param concatFile: the joined segments to mux with the audio instead
+                           of encoding frames from ToSink()
+        '''
         GObject.threads_init()
 
         self.ready = threading.Event()
@@ -140,13 +313,54 @@ class _GStreamerRenderer(BaseRenderer):
         self.imgDuration = int(round(1000 * Gst.MSECOND / frameRate.AsFloat()))
         self._Log(logging.DEBUG, "set imgDuration=%s", self.imgDuration)
 
-        outFile = os.path.join(self.GetOutputPath(),
-                               "output.%s" % self._GetExtension())
+        firstFrame, endFrame = self.GetFrameRange()
+        # the audio of a partial render starts with its first frame
+        self.audioStart = firstFrame * self.imgDuration
+        if self.__segmentFile:
+            self.frameOffset = self.__segments[self.__idxSegment][1]
+        else:
+            self.frameOffset = firstFrame
+
+        if self.IsPartial():
+            outFile = os.path.join(self.GetOutputPath(),
+                                   "output_%d-%d.%s" % (firstFrame, endFrame,
+                                                        self._GetExtension()))
+        else:
+            outFile = os.path.join(self.GetOutputPath(),
+                                   "output.%s" % self._GetExtension())
 
         self.pipeline = Gst.Pipeline()
 
-        caps = Gst.caps_from_string(
-            "image/jpeg,framerate={0}".format(frameRate.AsStr()))
+        if concatFile:
+            self.finalTime = self.__GetSegmentsFrameCount() * self.imgDuration
+            videoOut = self.__CreateConcatSource(concatFile)
+        else:
+            videoOut = self.__CreateVideoEncoding()
+
+        if self.__segmentFile:
+            self.__LinkSegmentSink(videoOut)
+        else:
+            self.__LinkOutput(videoOut, outFile, concatFile is not None)
+
+        self.__StartPipeline()
+
+    def __CreateVideoEncoding(self):
+        '''
+        Creates the elements from the appsrc to the video encoder.
+        :returns: the encoder element
+        '''
+        frameRate = self.GetProfile().GetFrameRate()
+        frameFormat = self._GetFrameFormat()
+        if frameFormat == "JPEG":
+            caps = Gst.caps_from_string(
+                "image/jpeg,framerate={0}".format(frameRate.AsStr()))
+        else:
+            width, height = self.GetProfile().GetResolution()
+            caps = Gst.caps_from_string(
+                "video/x-raw,format={0},width={1},height={2},framerate={3},"
+                "pixel-aspect-ratio=1/1,interlace-mode=progressive{4}".format(
+                    frameFormat, width, height, frameRate.AsStr(),
+                    ",colorimetry=bt601" if frameFormat == "I420" else ""))
         videoSrc = Gst.ElementFactory.make("appsrc")
         videoSrc.set_property("block", True)
         videoSrc.set_property("caps", caps)
@@ -156,13 +370,32 @@ class _GStreamerRenderer(BaseRenderer):
         queueVideo = Gst.ElementFactory.make("queue")
         self.pipeline.add(queueVideo)
 
-        jpegDecoder = Gst.ElementFactory.make("jpegdec")
-        self.pipeline.add(jpegDecoder)
+        if frameFormat == "JPEG":
+            jpegDecoder = Gst.ElementFactory.make("jpegdec")
+            self.pipeline.add(jpegDecoder)
+        else:
+            jpegDecoder = None
 
         colorConverter = Gst.ElementFactory.make("videoconvert")
         self.pipeline.add(colorConverter)
 
+        encWidth, encHeight = self.GetProfile().GetEncoderResolution()
+        if (encWidth, encHeight) != self.GetProfile().GetResolution():
+            # upscale the frames of a proxy
+            videoScaler = Gst.ElementFactory.make("videoscale")
+            self.pipeline.add(videoScaler)
+
+            scaleFilter = Gst.ElementFactory.make("capsfilter")
+            scaleFilter.set_property("caps", Gst.caps_from_string(
+                "video/x-raw,width={0},height={1},pixel-aspect-ratio=1/1".format(
+                    encWidth, encHeight)))
+            self.pipeline.add(scaleFilter)
+        else:
+            videoScaler = None
+
         videoEnc = self._GetVideoEncoder()
+        if self.__segmentFile:
+            self._PrepareSegmentEncoder(videoEnc)
         self.pipeline.add(videoEnc)
 
         if self.GetTypedProperty("RenderSubtitle", bool) and Gst.ElementFactory.find("textoverlay"):
@@ -171,15 +404,31 @@ class _GStreamerRenderer(BaseRenderer):
             self.pipeline.add(self.textoverlay)
 
         # link elements for video stream
-        videoSrc.link(jpegDecoder)
-        jpegDecoder.link(colorConverter)
+        if jpegDecoder:
+            videoSrc.link(jpegDecoder)
+            jpegDecoder.link(colorConverter)
+        else:
+            # videoconvert passes I420 through to the encoder
+            videoSrc.link(colorConverter)
+        videoOut = colorConverter
+        if videoScaler:
+            colorConverter.link(videoScaler)
+            videoScaler.link(scaleFilter)
+            videoOut = scaleFilter
         if self.textoverlay:
-            colorConverter.link(self.textoverlay)
+            videoOut.link(self.textoverlay)
             self.textoverlay.link(queueVideo)
         else:
-            colorConverter.link(queueVideo)
+            videoOut.link(queueVideo)
         queueVideo.link(videoEnc)
 
+        return videoEnc
+
+    def __LinkOutput(self, videoEnc, outFile, parsed=False):
+        '''
+        Creates the audio elements and links them and the video to the muxer.
+        :param parsed: True if the video stream is parsed already
+        '''
         audioEnc = None
         if self.GetAudioFiles():
             self.concat = Gst.ElementFactory.make("concat")
@@ -188,6 +437,9 @@ class _GStreamerRenderer(BaseRenderer):
             srcpad = self.concat.get_static_pad("src")
             srcpad.add_probe(Gst.PadProbeType.BUFFER,  # | Gst.PadProbeType.EVENT_DOWNSTREAM,
                              self._GstProbeBuffer)
+            if self.audioStart:
+                # buffers before the start are dropped in _GstProbeBuffer
+                srcpad.set_offset(-self.audioStart)
 
             self._GstAddAudioFile(self.GetAudioFiles()[self.idxAudioFile])
 
@@ -208,7 +460,13 @@ class _GStreamerRenderer(BaseRenderer):
             audiorate.link(audioQueue)
             audioQueue.link(audioEnc)
 
-        if self.GetProfile().IsMPEGProfile():
+        if parsed:
+            if audioEnc and self.GetProfile().IsMPEGProfile():
+                ap = Gst.ElementFactory.make("mpegaudioparse")
+                self.pipeline.add(ap)
+                audioEnc.link(ap)
+                audioEnc = ap
+        elif self.GetProfile().IsMPEGProfile():
             vp = Gst.ElementFactory.make("mpegvideoparse")
             self.pipeline.add(vp)
             videoEnc.link(vp)
@@ -246,6 +504,50 @@ class _GStreamerRenderer(BaseRenderer):
 
         mux.link(sink)
 
+
+    def __CreateConcatSource(self, concatFile):
+        '''
+        Creates the elements that read the joined segments.
+        :returns: the parser element
+        '''
+        caps, parserName = self._GetSegmentFormat()
+        frameRate = self.GetProfile().GetFrameRate()
+
+        videoSrc = Gst.ElementFactory.make("filesrc")
+        videoSrc.set_property("location", concatFile)
+        self.pipeline.add(videoSrc)
+
+        capsFilter = Gst.ElementFactory.make("capsfilter")
+        capsFilter.set_property("caps", Gst.caps_from_string(
+            "{0},framerate={1}".format(caps, frameRate.AsStr())))
+        self.pipeline.add(capsFilter)
+
+        # the parser timestamps the frames by the framerate
+        parser = Gst.ElementFactory.make(parserName)
+        self.pipeline.add(parser)
+
+        videoSrc.link(capsFilter)
+        capsFilter.link(parser)
+        return parser
+
+    def __LinkSegmentSink(self, videoEnc):
+        '''
+        Links the video encoder to the file of the current segment, the
+        segment has no audio and no container.
+        '''
+        caps = self._GetSegmentFormat()[0]
+        capsFilter = Gst.ElementFactory.make("capsfilter")
+        capsFilter.set_property("caps", Gst.caps_from_string(caps))
+        self.pipeline.add(capsFilter)
+
+        sink = Gst.ElementFactory.make("filesink")
+        sink.set_property("location", self.__segmentFile)
+        self.pipeline.add(sink)
+
+        videoEnc.link(capsFilter)
+        capsFilter.link(sink)
+
+    def __StartPipeline(self):
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
         bus.connect("message", self._GstOnMessage)
@@ -281,11 +583,18 @@ class _GStreamerRenderer(BaseRenderer):
         audioSrc.link(audioDec)
 
     def Finalize(self):
+        if self.__segmentFile:
+            # frames of the segment were skipped
+            self.__FinishSegment(False)
+
         if not self.finished:
             self.finished = True
 
         self.__CleanUp()
 
+        if self.__segments is not None and not self.__aborted:
+            self.__AssembleSegments()
+
     def _GetBitrate(self):
         bitrate = self.GetTypedProperty("Bitrate", int,
                                         self.GetProfile().GetBitrate())
@@ -293,6 +602,13 @@ class _GStreamerRenderer(BaseRenderer):
             raise RendererException(_(u"Bitrate must be a number!"))
         return bitrate
 
+    def _GetFrameFormat(self):
+        frameFormat = self.GetProperty("FrameFormat").upper()
+        if frameFormat not in ("I420", "RGB", "JPEG"):
+            raise RendererException(
+                _(u"FrameFormat must be one of I420, RGB or JPEG!"))
+        return frameFormat
+
     def _GstOnMessage(self, bus, msg):  # pylint: disable=unused-argument
         '''
         Gstreamer message handler for messages in gstreamer event bus.
@@ -366,7 +682,7 @@ class _GStreamerRenderer(BaseRenderer):
                 self.srtParse = SrtParser(
                     srtPath, self.GetProfile().GetFrameRate().AsFloat())
 
-            subtitle = self.srtParse.Get(self.idxFrame)
+            subtitle = self.srtParse.Get(self.frameOffset + self.idxFrame)
             self.textoverlay.set_property("text", subtitle)
 
         self.idxFrame += 1
@@ -396,7 +712,7 @@ class _GStreamerRenderer(BaseRenderer):
         Gstreamer pad probe callback to check if the current stream time has
         reached the final time (usually the length of the overall audio stream).
         If final time has reached send eos event (end of stream) to finish the
-        pipeline
+        pipeline. Audio before the first frame of a partial render is dropped.
         :param srcPad: src pad of the muxer
         :param probeInfo: GstPadProbeInfo object
         '''
@@ -406,9 +722,14 @@ class _GStreamerRenderer(BaseRenderer):
             self.ptsOffset += self.ptsLast
         self.ptsLast = buf.pts
 
-        if self.finalTime is None:
+        # position within the output, negative before the start of a
+        # partial render
+        position = self.ptsOffset + buf.pts - self.audioStart
+        if position < 0:
+            return Gst.PadProbeReturn.DROP
+        elif self.finalTime is None:
             return Gst.PadProbeReturn.PASS
-        elif self.ptsOffset + buf.pts >= self.finalTime:
+        elif position >= self.finalTime:
             return Gst.PadProbeReturn.DROP
         else:
             return Gst.PadProbeReturn.PASS
@@ -468,6 +789,13 @@ class MkvX264AC3(_GStreamerRenderer):
 #         audioEnc.set_property("bitrate", 192)
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/x-h264,stream-format=byte-stream,alignment=au", "h264parse"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("bframes", 0)
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("x264enc")
         videoEnc.set_property("bitrate", self._GetBitrate())
@@ -515,6 +843,13 @@ class Mp4X264AAC(_GStreamerRenderer):
         audioEnc = Gst.ElementFactory.make("avenc_aac")
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/x-h264,stream-format=byte-stream,alignment=au", "h264parse"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("bframes", 0)
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("x264enc")
         videoEnc.set_property("bitrate", self._GetBitrate())
@@ -561,6 +896,13 @@ class MkvX265AC3(_GStreamerRenderer):
         audioEnc = Gst.ElementFactory.make("avenc_ac3")
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/x-h265,stream-format=byte-stream,alignment=au", "h265parse"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("option-string", "bframes=0")
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("x265enc")
         videoEnc.set_property("bitrate", self._GetBitrate())
@@ -642,6 +984,17 @@ class VCDFormat(_GStreamerRenderer):
         audioEnc = Gst.ElementFactory.make("avenc_mp2")
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/mpeg,mpegversion=1,systemstream=false", "mpegvideoparse"
+
+    @staticmethod
+    def _GetSegmentEndCode():
+        return b"\x00\x00\x01\xb7"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("b-per-refframe", 0)
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("mpeg2enc")
         videoEnc.set_property("format", 1)
@@ -682,6 +1035,17 @@ class SVCDFormat(_GStreamerRenderer):
         audioEnc = Gst.ElementFactory.make("avenc_mp2")
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/mpeg,mpegversion=2,systemstream=false", "mpegvideoparse"
+
+    @staticmethod
+    def _GetSegmentEndCode():
+        return b"\x00\x00\x01\xb7"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("b-per-refframe", 0)
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("mpeg2enc")
         videoEnc.set_property("format", 4)
@@ -731,6 +1095,17 @@ class DVDFormat(_GStreamerRenderer):
         audioEnc = Gst.ElementFactory.make("avenc_mp2")
         return audioEnc
 
+    @staticmethod
+    def _GetSegmentFormat():
+        return "video/mpeg,mpegversion=2,systemstream=false", "mpegvideoparse"
+
+    @staticmethod
+    def _GetSegmentEndCode():
+        return b"\x00\x00\x01\xb7"
+
+    def _PrepareSegmentEncoder(self, videoEnc):
+        videoEnc.set_property("b-per-refframe", 0)
+
     def _GetVideoEncoder(self):
         videoEnc = Gst.ElementFactory.make("mpeg2enc")
         videoEnc.set_property("format", 8)
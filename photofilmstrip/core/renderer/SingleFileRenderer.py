@@ -19,6 +19,7 @@
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 #
 
+import io
 import os
 
 from photofilmstrip.core.BaseRenderer import BaseRenderer, \
@@ -47,7 +48,8 @@ class SingleFileRenderer(BaseRenderer, FinalizeHandler):
             return BaseRenderer.GetDefaultProperty(prop)
 
     def Prepare(self):
-        pass
+        # number the files like in a full render
+        self._counter = self.GetFrameRange()[0]
 
     def GetFinalizeHandler(self):
         return self
@@ -62,15 +64,30 @@ class SingleFileRenderer(BaseRenderer, FinalizeHandler):
     def ProcessFinalize(self, pilImg):
         '''
         overrides FinalizeHandler.ProcessFinalize
+        The frames are encoded by the workers in any order, ToSink() writes
+        them in order.
         :param pilImg:
         '''
+        res = io.BytesIO()
+        pilImg.save(res, "JPEG", quality=95)
+        return res.getvalue()
+
+    def ToSink(self, data):
         self._counter += 1
 
         newFilename = os.path.join(self.GetOutputPath(),
                                    '%09d.%s' % (self._counter,
                                                 "jpg"))
+        with open(newFilename, "wb") as fd:
+            fd.write(data)
 
-        pilImg.save(newFilename, "JPEG", quality=95)
+    def SkipFrame(self):
+        '''
+        overrides BaseRenderer.SkipFrame
+        Leaves out the number of the failed frame, so the following files
+        are numbered like in a full render.
+        '''
+        self._counter += 1
 
     def Finalize(self):
         pass
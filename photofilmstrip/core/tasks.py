@@ -25,6 +25,8 @@ from photofilmstrip.core import PILBackend
 
 class Task:
 
+    __slots__ = ("info", "subTasks")
+
     def __init__(self):
         self.info = u""
         self.subTasks = []
@@ -53,6 +55,8 @@ class Task:
 
 class TaskSubtitle(Task):
 
+    __slots__ = ("__outputPath", "__picCountFactor", "__pics")
+
     def __init__(self, outputPath, picCountFactor, pics):
         Task.__init__(self)
         self.__outputPath = outputPath
@@ -78,20 +82,29 @@ class TaskSubtitle(Task):
 
 class TaskLoadPic(Task):
 
-    def __init__(self, picture):
+    __slots__ = ("picture", "reduction", "__key")
+
+    def __init__(self, picture, reduction=1):
         Task.__init__(self)
         self.picture = picture
+        self.reduction = reduction
+        self.__key = None
 
     def GetKey(self):
-        return 'LoadPic_{}'.format(
-            self.picture.GetKey())
+        # the task may be shared by many frames, see FramePlan
+        if self.__key is None:
+            self.__key = 'LoadPic_{}_{}'.format(
+                self.picture.GetKey(), self.reduction)
+        return self.__key
 
     def Run(self, jobContext):
-        return PILBackend.GetImage(self.picture)
+        return PILBackend.GetSourceImage(self.picture, self.reduction)
 
 
 class TaskImaging(Task):
 
+    __slots__ = ("resolution", "draft")
+
     def __init__(self, resolution):
         Task.__init__(self)
         self.resolution = resolution
@@ -103,11 +116,16 @@ class TaskImaging(Task):
 
 class TaskCropResize(TaskImaging):
 
-    def __init__(self, picture, rect, resolution):
+    __slots__ = ("picture", "rect", "taskLoadPic")
+
+    def __init__(self, picture, rect, resolution, reduction=1,
+                 taskLoadPic=None):
         TaskImaging.__init__(self, resolution)
         self.picture = picture
         self.rect = rect
-        self.taskLoadPic = TaskLoadPic(picture)
+        if taskLoadPic is None:
+            taskLoadPic = TaskLoadPic(picture, reduction)
+        self.taskLoadPic = taskLoadPic
         self.subTasks.append(self.taskLoadPic)
 
     def GetKey(self):
@@ -115,23 +133,32 @@ class TaskCropResize(TaskImaging):
             self.taskLoadPic.GetKey(), self.rect, self.resolution)
 
     def Run(self, jobContext):
-        image = jobContext.ProcessSubTask(self.taskLoadPic)
-        img = PILBackend.CropAndResize(image,
-                                       self.rect,
-                                       self.resolution,
-                                       self.draft)
-        return img
+        source = jobContext.ProcessSubTask(self.taskLoadPic)
+        rect = self.rect
+        reduction = self.taskLoadPic.reduction
+        if reduction > 1:
+            # the rect refers to the full size picture
+            rect = tuple(value / reduction for value in rect)
+        img = source.CropAndResize(rect,
+                                   self.resolution,
+                                   self.draft)
+        return PILBackend.ApplyEffect(img, self.picture.GetEffect())
 
 
 class TaskTrans(TaskImaging):
 
-    def __init__(self, kind, percentage,
-                 pic1, rect1, pic2, rect2, resolution):
+    __slots__ = ("kind", "percentage", "taskPic1", "taskPic2")
+
+    def __init__(self, kind, percentage, taskPic1, taskPic2, resolution):
+        '''
+        :param taskPic1: the TaskCropResize of the picture to fade out
+        :param taskPic2: the TaskCropResize of the picture to fade in
+        '''
         TaskImaging.__init__(self, resolution)
         self.kind = kind
         self.percentage = percentage
-        self.taskPic1 = TaskCropResize(pic1, rect1, resolution)
-        self.taskPic2 = TaskCropResize(pic2, rect2, resolution)
+        self.taskPic1 = taskPic1
+        self.taskPic2 = taskPic2
         self.subTasks.append(self.taskPic1)
         self.subTasks.append(self.taskPic2)
 
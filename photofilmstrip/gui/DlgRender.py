@@ -33,12 +33,14 @@ from photofilmstrip.gui.ctrls.PnlDlgHeader import PnlDlgHeader
 from photofilmstrip.gui.HelpViewer import HelpViewer
 from photofilmstrip.gui.DlgRendererProps import DlgRendererProps
 
-[wxID_DLGRENDER, wxID_DLGRENDERCBDRAFT, wxID_DLGRENDERCHOICEFORMAT,
- wxID_DLGRENDERCHOICEPROFILE,
+[wxID_DLGRENDER, wxID_DLGRENDERCBDRAFT, wxID_DLGRENDERCBPROXYUPSCALE,
+ wxID_DLGRENDERCHOICEFORMAT, wxID_DLGRENDERCHOICEPROFILE,
+ wxID_DLGRENDERCHOICEPROXY,
  wxID_DLGRENDERCMDCANCEL, wxID_DLGRENDERCMDHELP,
  wxID_DLGRENDERCMDRENDERERPROPS, wxID_DLGRENDERCMDSTART, wxID_DLGRENDERPNLHDR,
  wxID_DLGRENDERPNLSETTINGS, wxID_DLGRENDERSTFORMAT, wxID_DLGRENDERSTPROFILE,
-] = [wx.NewId() for _init_ctrls in range(12)]
+ wxID_DLGRENDERSTPROXY,
+] = [wx.NewId() for _init_ctrls in range(15)]
 
 
 class DlgRender(wx.Dialog):
@@ -80,6 +82,13 @@ class DlgRender(wx.Dialog):
         parent.AddSpacer(8)
         parent.AddSpacer(8)
         parent.Add(self.cbDraft, 0, border=0, flag=0)
+        parent.AddSpacer(8)
+        parent.Add(self.stProxy, 0, border=0,
+              flag=wx.ALIGN_CENTER_VERTICAL)
+        parent.Add(self.choiceProxy, 0, border=0, flag=wx.EXPAND)
+        parent.AddSpacer(8)
+        parent.AddSpacer(8)
+        parent.Add(self.cbProxyUpscale, 0, border=0, flag=0)
 
     def _init_coll_sizerSettings_Growables(self, parent):
         # generated method, don't edit
@@ -153,6 +162,23 @@ class DlgRender(wx.Dialog):
             size=wx.Size(-1, -1), style=0)
         self.cbDraft.SetValue(False)
 
+        self.stProxy = wx.StaticText(id=wxID_DLGRENDERSTPROXY,
+            label=_(u'Proxy:'), name=u'stProxy', parent=self.pnlSettings,
+            pos=wx.Point(-1, -1), size=wx.Size(-1, -1), style=0)
+
+        self.choiceProxy = wx.Choice(choices=[],
+            id=wxID_DLGRENDERCHOICEPROXY, name=u'choiceProxy',
+            parent=self.pnlSettings, pos=wx.Point(-1, -1), size=wx.Size(-1,
+            - 1), style=0)
+        self.choiceProxy.Bind(wx.EVT_CHOICE, self.OnChoiceProxy,
+            id=wxID_DLGRENDERCHOICEPROXY)
+
+        self.cbProxyUpscale = wx.CheckBox(id=wxID_DLGRENDERCBPROXYUPSCALE,
+            label=_(u'Scale up to profile resolution'),
+            name=u'cbProxyUpscale', parent=self.pnlSettings,
+            pos=wx.Point(-1, -1), size=wx.Size(-1, -1), style=0)
+        self.cbProxyUpscale.SetValue(False)
+
         self.cmdHelp = wx.Button(id=wx.ID_HELP, label=_(u'&Help'),
             name=u'cmdHelp', parent=self, pos=wx.Point(-1, -1),
             size=wx.Size(-1, -1), style=0)
@@ -180,6 +206,12 @@ class DlgRender(wx.Dialog):
         self.pnlHdr.SetBitmap(wx.ArtProvider.GetBitmap('PFS_RENDER_32'))
 
         self.cbDraft.SetToolTip(_(u"Activate this option to generate a preview of your PhotoFilmStrip. The rendering process will speed up dramatically, but results in lower quality."))
+        self.choiceProxy.SetToolTip(_(u"Renders a proxy at a fraction of the resolution of the profile. Pictures are loaded at a lower scale, so the rendering process is much faster."))
+
+        for label, factor in ((_(u"Off"), 1), (u"1/2", 2), (u"1/4", 4)):
+            self.choiceProxy.Append(label, factor)
+        self.choiceProxy.SetSelection(0)
+        self.OnChoiceProxy(None)
 
         self.aspectRatio = aspectRatio
         self.__InitProfiles()
@@ -200,6 +232,8 @@ class DlgRender(wx.Dialog):
 
         self.profile = None
         self.draftMode = False
+        self.proxyFactor = 1
+        self.proxyUpscale = False
         self.rendererClass = None
 
     def __GetChoiceDataSelected(self, choice):
@@ -278,9 +312,15 @@ class DlgRender(wx.Dialog):
 
         self.profile = profile
         self.draftMode = self.cbDraft.GetValue()
+        self.proxyFactor = self.__GetChoiceDataSelected(self.choiceProxy)
+        self.proxyUpscale = self.cbProxyUpscale.GetValue()
 
         self.EndModal(wx.ID_OK)
 
+    def OnChoiceProxy(self, event):
+        self.cbProxyUpscale.Enable(
+            self.__GetChoiceDataSelected(self.choiceProxy) > 1)
+
     def OnCmdCancelButton(self, event):
         self.EndModal(wx.ID_CANCEL)
 
@@ -304,6 +344,12 @@ class DlgRender(wx.Dialog):
     def GetDraftMode(self):
         return self.draftMode
 
+    def GetProxyFactor(self):
+        return self.proxyFactor
+
+    def GetProxyUpscale(self):
+        return self.proxyUpscale
+
     def GetRendererClass(self):
         return self.rendererClass
 
@@ -543,6 +543,8 @@ class PnlPfsProject(PnlEditorPage, Observer):
 
             profile = dlg.GetProfile()
             draftMode = dlg.GetDraftMode()
+            proxyFactor = dlg.GetProxyFactor()
+            proxyUpscale = dlg.GetProxyUpscale()
             rendererClass = dlg.GetRendererClass()
         finally:
             dlg.Destroy()
@@ -550,7 +552,9 @@ class PnlPfsProject(PnlEditorPage, Observer):
         ar = ActionRender(project,
                           profile,
                           rendererClass,
-                          draftMode)
+                          draftMode,
+                          proxyFactor=proxyFactor,
+                          proxyUpscale=proxyUpscale)
         try:
             ar.Execute()
             renderJob = ar.GetRenderJob()
@@ -169,6 +169,23 @@ class Settings(Singleton):
                 pass
         return None
 
+    def SetRenderProcesses(self, value):
+        self.Load()
+        self.cp.set("General", "RenderProcesses", str(value))
+        self.Save()
+
+    def GetRenderProcesses(self):
+        '''
+        Returns True if the render workers use worker processes.
+        '''
+        self.Load()
+        if self.cp.has_option("General", "RenderProcesses"):
+            try:
+                return self.cp.getboolean("General", "RenderProcesses")
+            except:
+                pass
+        return False
+
     def SetLastKnownVersion(self, version):
         self.Load()
         self.cp.set("General", "LastKnownVersion", version)
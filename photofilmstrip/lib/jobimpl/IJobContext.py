@@ -12,6 +12,20 @@ class IJobContext:
     def GetGroupId(self):
         raise NotImplementedError
 
+    def GetPriority(self):
+        """
+        Returns the priority class, workloads of JobContexts with a higher
+        priority are processed first.
+        """
+        raise NotImplementedError()
+
+    def GetWeight(self):
+        """
+        Returns the share of the workers of the group if several JobContexts
+        are processed at once.
+        """
+        raise NotImplementedError()
+
     def GetWorkLoad(self):
         raise NotImplementedError()
 
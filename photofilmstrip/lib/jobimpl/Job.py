@@ -16,10 +16,18 @@ class Job(IJobContext):
     in a queue.
     '''
 
+    # priority classes, a worker always takes the next workload of the
+    # highest class, so other jobs are paused between their workloads
+    PRIORITY_BATCH = 0
+    PRIORITY_THUMBNAIL = 1
+    PRIORITY_INTERACTIVE = 2
+
     def __init__(self, target=None, args=None, kwargs=None,
                  groupId="general"):
         IJobContext.__init__(self)
         self.__groupId = groupId
+        self.__priority = Job.PRIORITY_BATCH
+        self.__weight = 1.0
 
         self.__logger = logging.getLogger("Job<%s> %s" % (groupId, self))
 
@@ -36,6 +44,26 @@ class Job(IJobContext):
     def GetGroupId(self):
         return self.__groupId
 
+    def GetPriority(self):
+        return self.__priority
+
+    def SetPriority(self, priority):
+        '''
+        Sets the priority class, e.g. PRIORITY_INTERACTIVE for a preview
+        that must not wait for a running export.
+        '''
+        self.__priority = priority
+
+    def GetWeight(self):
+        return self.__weight
+
+    def SetWeight(self, weight):
+        '''
+        Sets the share of the workers, e.g. a job with weight 2 gets twice
+        as many workloads processed as a job with weight 1.
+        '''
+        self.__weight = weight
+
     def AddWorkLoad(self, workLoad):
         assert isinstance(workLoad, IWorkLoad)
         self.__workQueue.put(workLoad)
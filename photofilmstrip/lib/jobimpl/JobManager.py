@@ -1,5 +1,6 @@
 # encoding: UTF-8
 
+import collections
 import logging
 import multiprocessing
 import queue
@@ -11,102 +12,132 @@ from photofilmstrip.lib.DestructionManager import Destroyable
 from .IVisualJobManager import IVisualJobManager
 from .LogVisualJobManager import LogVisualJobManager
 from .Worker import Worker, WorkerAbortSignal
+from .WorkerProcess import WorkerProcess
 from .JobAbortedException import JobAbortedException
 
 
-class _JobCtxGroup:
+class _ActiveCtx:
     '''
-    Handles the processing state of a JobContext and manages a queue with
-    JobContexts that are waiting to be processed.
+    The processing state of a started JobContext.
     '''
 
-    def __init__(self, workers):
-        self.__idleQueue = queue.Queue()
+    def __init__(self, jobContext, passValue):
+        self.jobContext = jobContext
+        # the share of the workers, workloads handed out are weighted by it
+        self.passValue = passValue
+        # number of workloads handed out and not processed yet
+        self.running = 0
+        # True while a worker retrieves a workload of the JobContext
+        self.busy = False
+        # True if the JobContext has no more workloads
+        self.exhausted = False
 
-        # holds the JobContext that is currently active
-        self.__active = None
+    def IsFinished(self):
+        return self.exhausted and not self.busy and self.running == 0
 
-        # counts how many workers has finished working on the active JobContext
-        self.__doneCount = 0
 
-        # if set the acitve JobContext has finshed
-        self.__doneEvent = threading.Event()
+class _JobCtxGroup:
+    '''
+    Handles the processing state of the active JobContexts and manages a queue
+    with JobContexts that are waiting to be processed. Several JobContexts are
+    active at once, the workers serve the highest priority class and share
+    the workers within a class by the weights.
+    '''
+
+    def __init__(self, workers):
+        self.__idleQueue = collections.deque()
+
+        # the JobContexts that are currently active
+        self.__active = []
 
         # a list with workers working for this context group
         self.__workers = workers
 
-        self.__lock = threading.Lock()
+        # notified if a JobContext is added or may provide a workload again
+        self.__changed = threading.Condition()
 
     def Put(self, jobContext):
         '''
-        Adds a JobContext to the queue
+        Adds a JobContext to the queue, None just wakes up the workers.
         :param jobContext:
         '''
-        self.__idleQueue.put(jobContext)
+        with self.__changed:
+            if jobContext is not None:
+                self.__idleQueue.append(jobContext)
+            self.__changed.notify_all()
 
     def Get(self):
         '''
-        Returns a JobContext from the queue. Blocks if no JobContext is waiting.
+        Returns a JobContext from the queue or None if no JobContext is
+        waiting.
         '''
-        return self.__idleQueue.get()
+        if self.__idleQueue:
+            return self.__idleQueue.popleft()
+        return None
 
     def __enter__(self):
-        self.__lock.acquire()
+        self.__changed.acquire()
         return self
 
     def __exit__(self, typ, value, traceback):
-        self.__lock.release()
+        self.__changed.release()
 
-    def Active(self):
+    def Wait(self):
         '''
-        Return the currently active JobContext.
+        Blocks until the state of the group changes, the group must be locked.
         '''
-        return self.__active
+        self.__changed.wait()
 
-    def SetActive(self, jobContext):
-        '''
-        Sets the given JobContext as active. Resets the counter of finished
-        workers and the doneEvent.
-        :param jobContext:
-        '''
-        self.__active = jobContext
-        if jobContext is not None:
-            self.__doneCount = 0
-            self.__doneEvent.clear()
-
-    def DoneCount(self):
-        '''
-        Returns the number of finished workers for the active JobContext.
-        Only used for logging purposes.
-        '''
-        return self.__doneCount
-
-    def CheckBusy(self):
-        '''
-        Returns True if workers are still busy with the active JobContext.
-        '''
-        return self.__doneCount < len(self.__workers)
+    def Notify(self):
+        self.__changed.notify_all()
 
-    def IncDoneCount(self):
+    def Activate(self, jobContext):
         '''
-        Must be called when a worker finished the last workload of the active
-        JobContext.
+        Adds a started JobContext. It starts with the least share of the
+        active JobContexts of its priority, so it neither waits for nor
+        overtakes them.
         '''
-        self.__doneCount += 1
-
-    def SetDoneEvent(self):
+        priority = jobContext.GetPriority()
+        passValue = min([actCtx.passValue for actCtx in self.__active
+                         if actCtx.jobContext.GetPriority() == priority]
+                        or [0])
+        actCtx = _ActiveCtx(jobContext, passValue)
+        self.__active.append(actCtx)
+        return actCtx
+
+    def Remove(self, actCtx):
+        self.__active.remove(actCtx)
+
+    def Find(self, jobContext):
+        for actCtx in self.__active:
+            if actCtx.jobContext is jobContext:
+                return actCtx
+        return None
+
+    def Select(self):
         '''
-        Must be called when the last worker finished the last workload of the
-        active JobContext.
+        Returns the active JobContext of the highest priority that got the
+        least share of the workers and may provide a workload or None.
         '''
-        self.__doneEvent.set()
+        result = None
+        for actCtx in self.__active:
+            if actCtx.busy or actCtx.exhausted:
+                continue
+            if result is None:
+                result = actCtx
+                continue
+            priority = actCtx.jobContext.GetPriority()
+            if priority > result.jobContext.GetPriority() or \
+                    (priority == result.jobContext.GetPriority() and
+                     actCtx.passValue < result.passValue):
+                result = actCtx
+        return result
 
-    def WaitDoneEvent(self):
+    def Active(self):
         '''
-        Must be called to block a finished worker until the last worker has
-        finished.
+        Returns the processing states of the active JobContexts.
         '''
-        self.__doneEvent.wait()
+        return list(self.__active)
 
     def Workers(self):
         return self.__workers
@@ -141,7 +172,11 @@ class JobManager(Singleton, Destroyable):
         if len(self.__visuals) == 0:
             self.__visuals.append(self.__defaultVisual)
 
-    def Init(self, workerCtxGroup=None, workerCount=None):
+    def Init(self, workerCtxGroup=None, workerCount=None, useProcesses=False):
+        '''
+        Creates the workers of a context group.
+        :param useProcesses: if True every worker owns a WorkerProcess
+        '''
         if workerCtxGroup is None:
             workerCtxGroup = JobManager.DEFAULT_CTXGROUP_ID
         if workerCount is None:
@@ -154,7 +189,12 @@ class JobManager(Singleton, Destroyable):
         i = 0
         while i < workerCount:
             self.__logger.debug("creating worker for group %s", workerCtxGroup)
-            worker = Worker(self, workerCtxGroup, i)
+            if useProcesses:
+                # spawned, see WorkerProcess
+                process = WorkerProcess("{0}-{1}-process".format(workerCtxGroup, i))
+            else:
+                process = None
+            worker = Worker(self, workerCtxGroup, i, process)
             workers.append(worker)
 
             i += 1
@@ -179,57 +219,97 @@ class JobManager(Singleton, Destroyable):
 
     def _GetWorkLoad(self, workerCtxGroup):
         '''
-        Retrieves a workload of the given context group.
+        Retrieves a workload of the given context group. Blocks until a
+        JobContext provides one.
         :param workerCtxGroup:
         '''
         jcGroup = self.__jobCtxGroups[workerCtxGroup]
 
-        try:
-            with jcGroup:
-                while jcGroup.Active() is None:
-                    jcIdle = jcGroup.Get()
-                    if jcIdle is None:
-                        raise WorkerAbortSignal()
+        selected = None
+        finished = []
+        with jcGroup:
+            while not self.__destroying:
+                jcIdle = jcGroup.Get()
+                while jcIdle is not None:
                     if self.__StartCtx(jcIdle):
-                        jcGroup.SetActive(jcIdle)
-
-                if self.__destroying:
-                    # if in destroying state raise Queue.Empty() to enter
-                    # the except section and get FinishCtx() called
-                    raise queue.Empty()
-                jobCtxActive = jcGroup.Active()
-                workLoad = jobCtxActive.GetWorkLoad()
-                return jobCtxActive, workLoad  # FIXME: no tuple
-        except queue.Empty:
-            # no more workloads, job done, only __FinishCtx() needs to be done
-            # wait for all workers to be done
-            with jcGroup:
-                jcGroup.IncDoneCount()
+                        jcGroup.Activate(jcIdle)
+                    jcIdle = jcGroup.Get()
 
-            if jcGroup.CheckBusy():
-                self.__logger.debug("<%s> block until ready... %s",
-                                    threading.currentThread().getName(),
-                                    jcGroup.DoneCount())
-                jcGroup.WaitDoneEvent()
-                self.__logger.debug("<%s> block released continuing... %s",
-                                    threading.currentThread().getName(),
-                                    jcGroup.DoneCount())
+                selected = jcGroup.Select()
+                if selected is not None:
+                    selected.busy = True
+                    break
+                jcGroup.Wait()
             else:
-                with jcGroup:
-                    jobCtxActive = jcGroup.Active()
-                    if jobCtxActive is not None:
-                        jcGroup.SetActive(None)
-                        self.__FinishCtx(jobCtxActive)
-
-                self.__logger.debug("<%s> set done... %s",
+                # finish the started JobContexts, the workers that are
+                # still busy finish theirs
+                for actCtx in jcGroup.Active():
+                    actCtx.exhausted = True
+                    if self.__CheckFinished(jcGroup, actCtx):
+                        finished.append(actCtx.jobContext)
+
+        if selected is None:
+            for jobCtx in finished:
+                self.__FinishCtx(jobCtx)
+            raise WorkerAbortSignal()
+
+        # the JobContext may block until it can provide a workload, so the
+        # other JobContexts are served meanwhile
+        actCtx = selected
+        jobCtx = actCtx.jobContext
+        try:
+            workLoad = jobCtx.GetWorkLoad()
+        except Exception as exc:
+            if not isinstance(exc, queue.Empty):
+                self.__logger.error("<%s> error retrieving workload of %s",
                                     threading.currentThread().getName(),
-                                    jcGroup.DoneCount())
-                jcGroup.SetDoneEvent()
-
-            if self.__destroying:
-                raise WorkerAbortSignal()
-            else:
-                raise queue.Empty()
+                                    jobCtx.GetName(), exc_info=1)
+                jobCtx.Abort("Error: %s" % exc)
+            # no more workloads, the job is done if all workloads are
+            # processed
+            with jcGroup:
+                actCtx.busy = False
+                actCtx.exhausted = True
+                self.__logger.debug("<%s> no more workloads %s, %s running",
+                                    threading.currentThread().getName(),
+                                    jobCtx.GetName(), actCtx.running)
+                finished = self.__CheckFinished(jcGroup, actCtx)
+                jcGroup.Notify()
+            if finished:
+                self.__FinishCtx(jobCtx)
+            raise queue.Empty()
+
+        with jcGroup:
+            actCtx.busy = False
+            actCtx.running += 1
+            actCtx.passValue += 1.0 / max(jobCtx.GetWeight(), 1e-3)
+            jcGroup.Notify()
+        return jobCtx, workLoad  # FIXME: no tuple
+
+    def _DoneWorkLoad(self, workerCtxGroup, jobContext):
+        '''
+        Must be called when a worker processed a workload of _GetWorkLoad().
+        The last worker finishes the JobContext, the others continue with
+        workloads of other JobContexts.
+        '''
+        jcGroup = self.__jobCtxGroups[workerCtxGroup]
+        with jcGroup:
+            actCtx = jcGroup.Find(jobContext)
+            actCtx.running -= 1
+            finished = self.__CheckFinished(jcGroup, actCtx)
+        if finished:
+            self.__FinishCtx(jobContext)
+
+    def __CheckFinished(self, jcGroup, actCtx):
+        '''
+        Removes a JobContext without workloads in progress from the group,
+        which must be locked. Returns True if the caller must finish it,
+        outside of the lock as Done() may take a while.
+        '''
+        if actCtx.IsFinished():
+            jcGroup.Remove(actCtx)
+            return True
+        return False
 
     def __StartCtx(self, ctx):
         self.__logger.debug("<%s> starting %s...",
@@ -16,19 +16,25 @@ class Worker(threading.Thread, IWorker):
     '''
     A worker thread that processes workloads of a JobContext. The worker belongs
     to a specific group id that decides which JobContexts are executed.
+    Optionally the worker owns a WorkerProcess that workloads can hand their
+    work to, see GetCurrentProcess().
     '''
 
-    def __init__(self, jobManager, ctxGroupId, num):
+    def __init__(self, jobManager, ctxGroupId, num, process=None):
         threading.Thread.__init__(self, name="{0}-{1}".format(ctxGroupId, num))
 
         self.__jobManager = jobManager
         self.__ctxGroupId = ctxGroupId
+        self.__process = process
 
         self.__logger = logging.getLogger("Worker")
 
     def GetContextGroupId(self):
         return self.__ctxGroupId
 
+    def GetProcess(self):
+        return self.__process
+
     def run(self):
         self.__logger.debug("<%s> Started...", self.getName())
         while 1:
@@ -46,13 +52,16 @@ class Worker(threading.Thread, IWorker):
             except WorkerAbortSignal:
                 break
 
-            if not isinstance(workLoad, IWorkLoad):
+            if isinstance(workLoad, IWorkLoad):
+                self.__ProcessWorkLoad(jobContext, workLoad)
+            else:
                 self.__logger.debug("<%s> Retrieved invalid job object '%s' from Queue: %s",
                                     self.getName(), jobContext, workLoad)
-                continue
 
-            self.__ProcessWorkLoad(jobContext, workLoad)
+            self.__jobManager._DoneWorkLoad(self.GetContextGroupId(), jobContext)  # IGNORE:W0212
 
+        if self.__process is not None:
+            self.__process.Stop()
         self.__logger.debug("<%s> Worker gone...", self.getName())
 
     def __ProcessWorkLoad(self, jobContext, workLoad):
@@ -77,5 +86,15 @@ class Worker(threading.Thread, IWorker):
             self.__logger.error("<%s> push result exception: %s", self.getName(), inst, exc_info=1)
 
 
+def GetCurrentProcess():
+    '''
+    Returns the WorkerProcess of the calling worker thread or None.
+    '''
+    thread = threading.current_thread()
+    if isinstance(thread, Worker):
+        return thread.GetProcess()
+    return None
+
+
 class WorkerAbortSignal(Exception):
     pass
@@ -0,0 +1,107 @@
+# encoding: UTF-8
+
+import logging
+import multiprocessing
+from multiprocessing import connection, resource_tracker
+import os
+import signal
+
+
+# the processes are started while other threads are running, forking them
+# could copy locks held by those threads
+_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class WorkerProcess:
+    '''
+    A child process that runs functions for a Worker, so the work is not
+    serialised by the GIL of the main process. The functions and their
+    arguments must be picklable, functions are called one after another.
+    The process is spawned, so it imports the main module again, which must
+    be guarded by if __name__ == "__main__".
+    '''
+
+    def __init__(self, name):
+        # all processes share one tracker for shared memory, so a segment
+        # created by a child can be released by the main process
+        resource_tracker.ensure_running()
+
+        self.__conn, childConn = _CONTEXT.Pipe()
+        self.__process = _CONTEXT.Process(target=_Serve, args=(childConn,),
+                                          name=name)
+        self.__process.daemon = True
+        self.__process.start()
+        childConn.close()
+
+        # state of the users of this process, e.g. what was sent already
+        self.data = {}
+
+        self.__logger = logging.getLogger("WorkerProcess")
+
+    def GetName(self):
+        return self.__process.name
+
+    def Call(self, func, *args):
+        '''
+        Runs func(*args) in the child process and returns its result.
+        Exceptions of func are raised again.
+        '''
+        try:
+            self.__conn.send((func, args))
+            success, result = self.__conn.recv()
+        except (EOFError, OSError) as err:
+            raise RuntimeError("worker process %s is gone: %s"
+                               % (self.GetName(), err))
+        if not success:
+            raise result
+        return result
+
+    def Stop(self):
+        try:
+            self.__conn.send(None)
+        except (EOFError, OSError):
+            pass
+        self.__process.join(3)
+        if self.__process.is_alive():
+            self.__logger.warning("<%s> terminating", self.GetName())
+            self.__process.terminate()
+        self.__conn.close()
+        # releases e.g. shared memory of the users
+        self.data.clear()
+
+
+def _Serve(conn):
+    # Ctrl+C is handled by the main process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    parent = multiprocessing.parent_process()
+    while 1:
+        try:
+            # the sentinel is ready if the main process died without
+            # closing the pipe
+            if parent.sentinel in connection.wait([conn, parent.sentinel]):
+                break
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+
+        func, args = msg
+        try:
+            reply = (True, func(*args))
+        except Exception as exc:  # IGNORE:R0703
+            logging.getLogger("WorkerProcess").debug("call failed",
+                                                     exc_info=1)
+            reply = (False, exc)
+
+        try:
+            conn.send(reply)
+        except Exception as exc:  # IGNORE:R0703
+            # e.g. an exception that cannot be pickled
+            conn.send((False, RuntimeError(str(exc))))
+
+    # the caches of the functions may still view shared memory that cannot
+    # be closed while the interpreter shuts down, so leave without cleanup
+    # like a forked process does
+    logging.shutdown()
+    os._exit(0)
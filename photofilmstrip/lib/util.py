@@ -52,3 +52,24 @@ def StartFile(filename):
             pass
     else:
         subprocess.Popen(["xdg-open", filename])
+
+
+def GetAvailableMemory():
+    '''
+    Returns the bytes of physical memory that are currently available or
+    None if the platform does not tell.
+    '''
+    # the free pages of sysconf do not count the page cache that can be
+    # reclaimed, Linux estimates the available memory in /proc/meminfo
+    try:
+        with open("/proc/meminfo") as fd:
+            for line in fd:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError, IndexError):
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
@@ -0,0 +1,130 @@
+# encoding: UTF-8
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image, ImageChops, ImageStat
+
+from photofilmstrip.core import PILBackend
+from photofilmstrip.core.Picture import Picture
+
+
+def _CreateImage(size):
+    '''
+    Creates an image with detail in every region, so misplaced tiles show up.
+    '''
+    detail = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 64)
+    horizontal = Image.linear_gradient("L").resize(size).rotate(90)
+    vertical = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", (detail, horizontal, vertical))
+
+
+def _MaxDiff(img1, img2):
+    diff = ImageChops.difference(img1, img2)
+    return max(band.getextrema()[1] for band in diff.split())
+
+
+class TiledImageTest(unittest.TestCase):
+    '''
+    Compares crops of a TiledImage with crops of the fully decoded image.
+    '''
+
+    SIZE = (640, 512)
+    RECTS = [((0, 0, 640, 512), (160, 128), False),
+             ((13.5, 20.25, 300, 169), (300, 169), False),
+             ((100.3, 50.7, 400, 225), (320, 180), False),
+             ((-50, -20, 500, 300), (250, 150), False),
+             ((0, 0, 640, 512), (100, 80), True),
+             ((610, 482, 30, 30), (60, 60), False)]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempDir = tempfile.mkdtemp()
+        cls.image = _CreateImage(cls.SIZE)
+        # 16 rows per strip, uncompressed
+        cls.stripFile = os.path.join(cls.tempDir, "strips.tif")
+        cls.image.save(cls.stripFile, tiffinfo={278: 16})
+        cls.jpegFile = os.path.join(cls.tempDir, "image.jpg")
+        cls.image.save(cls.jpegFile, quality=95)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempDir)
+
+    def testStripLayout(self):
+        with Image.open(self.stripFile) as pilImg:
+            self.assertEqual(len(pilImg.tile), 32)
+
+    def testCropMatchesFullDecode(self):
+        for exifOrientation in (1, 3, 6, 7):
+            for rotation in (0, 1):
+                for mode in ("RGB", "L"):
+                    fullImg = PILBackend.Orientate(self.image, exifOrientation,
+                                                   rotation).convert(mode)
+                    pyramid = PILBackend.ImagePyramid(fullImg)
+                    # a small cache, so tiles get evicted and decoded again
+                    tiledImg = PILBackend.TiledImage(self.stripFile,
+                                                     exifOrientation,
+                                                     rotation, mode,
+                                                     maxBytes=100000)
+                    self.assertEqual(tiledImg.GetSize(), fullImg.size)
+                    for rect, size, draft in self.RECTS:
+                        expected = pyramid.CropAndResize(rect, size, draft)
+                        actual = tiledImg.CropAndResize(rect, size, draft)
+                        self.assertEqual(actual.size, size)
+                        self.assertLessEqual(
+                            _MaxDiff(actual, expected), 2,
+                            (exifOrientation, rotation, mode, rect, size))
+
+    def testReduction(self):
+        fullImg = self.image.resize((320, 256), Image.BOX)
+        pyramid = PILBackend.ImagePyramid(fullImg)
+        tiledImg = PILBackend.TiledImage(self.stripFile, reduction=2)
+        for rect, size in (((10, 10, 160, 90), (160, 90)),
+                           ((0, 0, 320, 256), (80, 64))):
+            self.assertLessEqual(
+                _MaxDiff(tiledImg.CropAndResize(rect, size),
+                         pyramid.CropAndResize(rect, size)), 2)
+
+    def testSourceSelection(self):
+        minPixels = PILBackend.TILED_MIN_PIXELS
+        PILBackend.TILED_MIN_PIXELS = 0
+        try:
+            source = PILBackend.GetSourceImage(Picture(self.stripFile))
+            self.assertIsInstance(source, PILBackend.TiledImage)
+            # a JPEG is a single tile, it is decoded with draft at once
+            source = PILBackend.GetSourceImage(Picture(self.jpegFile), 2)
+            self.assertIsInstance(source, PILBackend.ImagePyramid)
+        finally:
+            PILBackend.TILED_MIN_PIXELS = minPixels
+
+    def testJpegDraftMatchesFullDecode(self):
+        with Image.open(self.jpegFile) as pilImg:
+            fullImg = pilImg.convert("RGB").resize((320, 256), Image.BOX)
+        pyramid = PILBackend.ImagePyramid(fullImg)
+        source = PILBackend.GetSourceImage(Picture(self.jpegFile), 2)
+        for rect, size in (((10, 10, 160, 90), (160, 90)),
+                           ((0, 0, 320, 256), (80, 64))):
+            diff = ImageChops.difference(source.CropAndResize(rect, size),
+                                         pyramid.CropAndResize(rect, size))
+            # the DCT scaling of draft differs slightly from a box filter
+            self.assertLessEqual(max(ImageStat.Stat(diff).mean), 2)
+
+    def testDecodeErrorFailsCrop(self):
+        truncFile = os.path.join(self.tempDir, "truncated.tif")
+        with open(self.stripFile, "rb") as src:
+            data = src.read()
+        with open(truncFile, "wb") as dest:
+            dest.write(data[:len(data) // 2])
+
+        tiledImg = PILBackend.TiledImage(truncFile)
+        # the first strips are complete
+        tiledImg.CropAndResize((0, 0, 64, 16), (64, 16))
+        with self.assertRaises(Exception):
+            tiledImg.CropAndResize((0, 496, 64, 16), (64, 16))
+
+
+if __name__ == "__main__":
+    unittest.main()
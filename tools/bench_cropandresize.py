@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# encoding: UTF-8
+#
+# Micro benchmark of PILBackend.CropAndResize(). Every case runs through the
+# kernel that CropAndResize() picks, through the reduce+resize kernel and
+# through the affine transformation it used for all rects before, so the
+# thresholds between the kernels can be checked. The error columns are the
+# mean absolute error against a Lanczos reference.
+#
+#   python3 tools/bench_cropandresize.py [-i IMAGE] [-r REPEAT]
+#
+
+import os
+import sys
+import timeit
+from optparse import OptionParser
+
+from PIL import Image, ImageChops, ImageStat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from photofilmstrip.core import PILBackend  # pylint: disable=wrong-import-position
+
+
+FRAME_SIZE = (1280, 720)
+
+# name, kernel picked by CropAndResize(), rect relative to the frame size
+CASES = [("1:1 aligned", "crop", (100, 100, 1.0)),
+         ("1:1 subpixel", "reduce+resize", (100.5, 100.25, 1.0)),
+         ("upscale 2x", "reduce+resize", (100, 100, 0.5)),
+         ("downscale 1.17x", "reduce+resize", (100, 100, 1.17)),
+         ("downscale 1.5x", "reduce+resize", (100, 100, 1.5)),
+         ("downscale 2x", "reduce", (100, 100, 2.0)),
+         ("downscale 3x", "reduce", (100, 100, 3.0)),
+         ("downscale 4x", "reduce", (100, 100, 4.0)),
+         ("subpixel 2x", "reduce+resize", (100.5, 100.25, 2.0)),
+         ("downscale 2.5x", "affine", (100, 100, 2.5)),
+         ("downscale 3.3x", "affine", (100, 100, 3.3)),
+         ("beyond bounds", "affine", (-200, -100, 2.0))]
+
+
+def Affine(pilImg, rect, size):
+    left, top, width, height = rect
+    return pilImg.transform(size,
+                            Image.AFFINE,
+                            [width / size[0], 0, left,
+                             0, height / size[1], top],
+                            Image.BILINEAR)
+
+
+def ReduceResize(pilImg, rect, size):
+    left, top, width, height = rect
+    return pilImg.resize(size, Image.BILINEAR,
+                         box=(left, top, left + width, top + height),
+                         reducing_gap=1.0)
+
+
+def Reference(pilImg, rect, size):
+    left, top, width, height = rect
+    if left < 0 or top < 0 or \
+            left + width > pilImg.size[0] or top + height > pilImg.size[1]:
+        return None
+    return pilImg.resize(size, Image.LANCZOS,
+                         box=(left, top, left + width, top + height))
+
+
+def MeanError(img, reference):
+    if reference is None:
+        return "  -  "
+    diff = ImageChops.difference(img, reference)
+    stat = ImageStat.Stat(diff)
+    return "%.2f" % (sum(stat.mean) / len(stat.mean))
+
+
+def CreateImage():
+    size = (6000, 4000)
+    detail = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 256)
+    zoomed = Image.effect_mandelbrot(size, (-0.75, 0.05, -0.7, 0.1), 256)
+    gradient = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", (detail, zoomed, gradient))
+
+
+def Measure(func, repeat):
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat, 1)) * 1000
+
+
+def main():
+    parser = OptionParser(usage="%prog [-i IMAGE] [-r REPEAT]")
+    parser.add_option("-i", "--image", dest="image",
+                      help="source image, a 6000x4000 test image if not set")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=10,
+                      help="runs per case, the fastest is reported")
+    options = parser.parse_args()[0]
+
+    if options.image:
+        pilImg = Image.open(options.image).convert("RGB")
+    else:
+        pilImg = CreateImage()
+    pilImg.load()
+
+    print("source %dx%d, frame %dx%d, best of %d runs"
+          % (pilImg.size + FRAME_SIZE + (options.repeat,)))
+    print("%-16s %-14s %18s %18s %18s" % ("case", "kernel", "CropAndResize",
+                                          "reduce+resize", "affine"))
+    for name, kernel, (left, top, factor) in CASES:
+        rect = (left, top, FRAME_SIZE[0] * factor, FRAME_SIZE[1] * factor)
+        reference = Reference(pilImg, rect, FRAME_SIZE)
+
+        columns = []
+        for func in (PILBackend.CropAndResize, ReduceResize, Affine):
+            if func is ReduceResize and reference is None:
+                # the box must lie within the image
+                columns.append("%18s" % "-")
+                continue
+            img = func(pilImg, rect, FRAME_SIZE)
+            duration = Measure(lambda: func(pilImg, rect, FRAME_SIZE),
+                               options.repeat)
+            columns.append("%8.1f ms (%s)" % (duration,
+                                              MeanError(img, reference)))
+
+        print("%-16s %-14s %s" % (name, kernel, " ".join(columns)))
+
+
+if __name__ == "__main__":
+    main()